@@ -2,7 +2,7 @@
 module.exports = {
   testEnvironment: 'node', // Use Node.js environment for tests
   transform: {
-    '^.+\\.js$': 'babel-jest', // Transpile JavaScript files using Babel
+    '^.+\\.m?js$': 'babel-jest', // Transpile JavaScript files, lib's .mjs modules included, using Babel
   },
   moduleFileExtensions: ['js', 'mjs'], // Support .js and .mjs files
 };
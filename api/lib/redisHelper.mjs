@@ -3,7 +3,7 @@ import dotenv from 'dotenv';
 import MisformedKeyError from './errors/redis/MisformedKeyError.js';
 import KeyNotFoundError from './errors/redis/KeyNotFound.js';
 import StudentNotEnrolledError from './errors/redis/StudentNotEnrolled.js';
-import { createClient } from 'redis';
+import { commandOptions, createClient } from 'redis';
 
 dotenv.config();
 
@@ -47,6 +47,139 @@ export async function getEntry(key, databaseIndex = 0) {
     }
 }
 
+/**
+ * Gets the value of one field of a hash in the database.
+ * @param {string} key - the key of the hash.
+ * @param {string} field - the field of the hash to get.
+ * @param {number} [databaseIndex=0] - the index the hash is stored in.
+ * @returns {object|null} the field's parsed value, or null if it is not set.
+ */
+export async function getHashEntry(key, field, databaseIndex = 0) {
+    const client = getClient(databaseIndex);
+    await client.connect();
+
+    try {
+        const res = await client.hGet(key, field);
+        return res === null || res === undefined ? null : JSON.parse(res);
+    } finally {
+        await client.quit();
+    }
+}
+
+/**
+ * Gets the hash field dbcron stores an assignment's precomputed statistics under.
+ * @param {string} section - the category of the assignment.
+ * @param {string} assignmentName - the assignment, or a name containing "Summary"
+ * for the whole section.
+ * @returns {string} the field name.
+ */
+function assignmentStatsField(section, assignmentName) {
+    return JSON.stringify([section, assignmentName.includes('Summary') ? null : assignmentName]);
+}
+
+/**
+ * Gets the statistics (count, average, min, max, median, percentiles and
+ * histogram) dbcron precomputed for an assignment at sync time.
+ * @param {string} section - the category of the assignment.
+ * @param {string} assignmentName - the assignment, or a "Summary" of the section.
+ * @returns {object|null} the statistics, or null if they have not been computed.
+ */
+export async function getAssignmentStats(section, assignmentName) {
+    return await getHashEntry('Stats', assignmentStatsField(section, assignmentName));
+}
+
+/**
+ * Checks whether dbcron has published the "Stats" hash, to tell an assignment
+ * without statistics from a database no sync has computed them for yet.
+ * @returns {Promise<boolean>} true once a sync has stored the statistics.
+ */
+export async function isStatsPublished() {
+    const client = getClient();
+    await client.connect();
+
+    try {
+        return await client.exists('Stats') === 1;
+    } finally {
+        await client.quit();
+    }
+}
+
+/**
+ * Parses the float32 .npy matrix dbcron publishes as "Score Matrix"
+ * (see dbcron/columnar.py).
+ * @param {Buffer} blob - the .npy bytes.
+ * @returns {{rows: number, cols: number, values: Float32Array}} the row-major matrix.
+ */
+function parseScoreMatrix(blob) {
+    if (blob.toString('latin1', 0, 6) !== '\x93NUMPY') {
+        throw new Error('Score Matrix is not in .npy format');
+    }
+    const headerStart = blob[6] === 1 ? 10 : 12;
+    const headerLength = blob[6] === 1 ? blob.readUInt16LE(8) : blob.readUInt32LE(8);
+    const header = blob.toString('latin1', headerStart, headerStart + headerLength);
+    const shape = header.match(/'shape': \((\d+), (\d+)\)/);
+    if (!header.includes("'descr': '<f4'") || !header.includes("'fortran_order': False") || !shape) {
+        throw new Error(`Unsupported Score Matrix layout: ${header.trim()}`);
+    }
+    const rows = Number(shape[1]);
+    const cols = Number(shape[2]);
+    const start = blob.byteOffset + headerStart + headerLength;
+    // Copied, since a Float32Array needs a 4-byte aligned offset
+    const values = new Float32Array(blob.buffer.slice(start, start + rows * cols * 4));
+    return { rows, cols, values };
+}
+
+/**
+ * Gets the scores behind an assignment's distribution, from the score matrix
+ * and roster indexes dbcron publishes at sync time: one read of the matrix for
+ * an assignment, or of the section's totals for a "Summary".
+ * Scores are stored as float32, so they are rounded back to 7 significant digits.
+ * @param {string} section - the category of the assignment.
+ * @param {string} assignmentName - the assignment, or a "Summary" of the section.
+ * @returns {Promise<Array<{studentName: string, studentEmail: string, score: number}>|null>}
+ * the students with a score, in roster order, or null if dbcron has not published
+ * the indexes yet.
+ */
+export async function getDistributionScores(section, assignmentName) {
+    const client = getClient();
+    await client.connect();
+
+    try {
+        let emails;
+        let scores;
+        if (assignmentName.includes('Summary')) {
+            emails = await client.zRange('Roster', 0, -1);
+            if (emails.length === 0 && !await client.exists('Roster')) {
+                return null;
+            }
+            scores = emails.length > 0 ? await client.zmScore(`Section Members:${section}`, emails) : [];
+        } else {
+            const [blob, index] = await client.mGet(
+                commandOptions({ returnBuffers: true }), ['Score Matrix', 'Score Matrix Index']);
+            if (blob === null || index === null) {
+                return null;
+            }
+            const { emails: matrixEmails, columns } = JSON.parse(index.toString('utf8'));
+            const { cols, values } = parseScoreMatrix(blob);
+            const col = columns.findIndex(([category, concept]) => category === section && concept === assignmentName);
+            emails = matrixEmails;
+            scores = emails.map((_, row) => (col < 0 || Number.isNaN(values[row * cols + col])
+                ? null : Number(values[row * cols + col].toPrecision(7))));
+        }
+
+        const present = emails.filter((_, i) => scores[i] !== null);
+        const names = present.length > 0 ? await client.hmGet('Roster Names', present) : [];
+        const presentScores = scores.filter((score) => score !== null);
+        return present.map((email, i) => ({
+            studentName: names[i],
+            studentEmail: email,
+            score: presentScores[i],
+        }));
+    } finally {
+        await client.quit();
+    }
+}
+
 /**
  * Gets the categories of all assignments from the Redis database.
  * @returns {object} the assignment categories.
@@ -55,6 +188,53 @@ export async function getCategories() {
     return await getEntry('Categories');
 }
 
+let studentSchema = null;
+
+/**
+ * Gets the column layout dbcron encodes positional student records against,
+ * re-reading it whenever a record names a version other than the cached one.
+ * @param {string} version - the schema version the record was written with.
+ * @returns {object} the schema: {version, columns, sections}.
+ */
+async function getStudentSchema(version) {
+    if (studentSchema?.version !== version) {
+        studentSchema = await getEntry('Student Schema');
+    }
+    if (studentSchema.version !== version) {
+        throw new Error(`Student record uses schema version ${version}, but ${studentSchema.version} is stored`);
+    }
+    return studentSchema;
+}
+
+/**
+ * Rebuilds a student record dbcron stored in its positional encoding
+ * ([version, legalName, scores, sectionTotals, total, grade]) into the keyed form.
+ * Keyed records are returned unchanged.
+ * @param {object|Array} record - the parsed record.
+ * @returns {object} the student's information.
+ */
+async function decodeStudentRecord(record) {
+    if (!Array.isArray(record)) {
+        return record;
+    }
+    const [version, legalName, scores, sectionTotals, total, grade] = record;
+    const schema = await getStudentSchema(version);
+    const assignments = {};
+    schema.columns.forEach(([category, concept], i) => {
+        assignments[category] ??= {};
+        assignments[category][concept] = scores[i];
+    });
+    return {
+        'Legal Name': legalName,
+        'Assignments': assignments,
+        'Aggregates': {
+            'Section Totals': Object.fromEntries(schema.sections.map((section, i) => [section, sectionTotals[i]])),
+            'Total': total,
+            'Grade': grade,
+        },
+    };
+}
+
 /**
  * Gets a specified student's information from the Redis database.
  * @param {string} email - The email of the student whose information to get.
@@ -72,7 +252,7 @@ export async function getStudent(email) {
     }
     try {
         const student = await getEntry(email);
-        return student;
+        return await decodeStudentRecord(student);
     } catch (err) {
         switch (typeof err) {
             case 'KeyNotFoundError':
@@ -111,6 +291,46 @@ export async function getStudentScores(email) {
     }
 }
 
+/**
+ * Gets a student's total for one section (category) of assignments.
+ * Uses the section totals precomputed by dbcron at sync time, and only sums the
+ * raw scores for entries written before those were stored.
+ * @param {string} email the email of the student whose information to get.
+ * @param {string} section the category of assignments to total.
+ * @returns {number|null} the section total, or null if the student has no numeric
+ * score in that section.
+ */
+export async function getStudentSectionTotal(email, section) {
+    let studentInfo;
+    try {
+        studentInfo = await getStudent(email);
+    } catch (err) {
+        if (err.name === 'KeyNotFoundError' || err.name === 'StudentNotEnrolledError') {
+            return null;
+        }
+        throw err;
+    }
+
+    const sectionTotals = studentInfo['Aggregates']?.['Section Totals'];
+    if (sectionTotals) {
+        return sectionTotals[section] ?? null;
+    }
+
+    const sectionScores = studentInfo['Assignments']?.[section];
+    if (!sectionScores) {
+        return null;
+    }
+    let total = 0;
+    let count = 0;
+    Object.values(sectionScores).forEach((score) => {
+        if (score != null && score !== '' && !isNaN(score)) {
+            total += Number(score);
+            count++;
+        }
+    });
+    return count > 0 ? total : null;
+}
+
 /**
  * Gets the total amount of points a user has gotten so far.
  * @param {string} email the email of the student whose information to get.
@@ -151,27 +371,59 @@ export async function getMaxScores() {
 }
 
 /**
- * Gets a list of all of the students in the class.
+ * Gets a list of the students in the class, in gradebook order.
  * Each student is represented as a list: [legalName, email]
+ * Reads the roster index dbcron maintains; only scans the keyspace for
+ * databases synced before that index existed.
+ * @param {number} [offset=0] - the position of the first student to return.
+ * @param {number} [limit=-1] - the maximum number of students to return, or -1 for all; 0 returns none.
  * @returns {Promise<Array<Array<string>>>} List of [legalName, email]
  */
-export async function getStudents() {
-    const client = await getClient();
+export async function getStudents(offset = 0, limit = -1) {
+    if (limit === 0) {
+        return [];
+    }
+    const client = getClient();
     await client.connect();
 
-    var keys = await client.keys('*@*');
-    const students = [];
+    try {
+        // ZRANGE's stop is inclusive, so a limit of 0 would otherwise mean "to the end"
+        const stop = limit < 0 ? -1 : offset + limit - 1;
+        const emails = await client.zRange('Roster', offset, stop);
+        if (emails.length > 0 || await client.exists('Roster')) {
+            const names = emails.length > 0 ? await client.hmGet('Roster Names', emails) : [];
+            return emails.map((email, i) => [names[i], email]);
+        }
 
-    for (const key of keys) {
-        const studentData = await getEntry(key)
-        students.push([studentData['Legal Name'], key]); 
+        const keys = await client.keys('*@*');
+        const students = [];
+        for (const key of keys) {
+            const studentData = JSON.parse(await client.get(key));
+            students.push([Array.isArray(studentData) ? studentData[1] : studentData['Legal Name'], key]);
+        }
+        return limit < 0 ? students.slice(offset) : students.slice(offset, offset + limit);
+    } finally {
+        await client.quit();
     }
-
-    await client.quit();
-    return students;
 }
 
+/**
+ * Gets the number of students in the class.
+ * @returns {Promise<number>} the size of the roster.
+ */
+export async function getStudentCount() {
+    const client = getClient();
+    await client.connect();
 
+    try {
+        if (await client.exists('Roster')) {
+            return await client.zCard('Roster');
+        }
+        return (await client.keys('*@*')).length;
+    } finally {
+        await client.quit();
+    }
+}
 
 /**
  * Gets the average score for a specific assignment across all students.
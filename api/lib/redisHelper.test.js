@@ -0,0 +1,223 @@
+const { createClient } = require('redis');
+const { getDistributionScores, getStudent, getStudentCount, getStudents } = require('./redisHelper.mjs');
+
+// Mock the Redis client and the connection settings
+jest.mock('redis', () => ({
+    createClient: jest.fn(),
+    commandOptions: jest.fn((options) => options),
+}));
+jest.mock('config', () => ({
+    get: jest.fn(() => 'test'),
+}));
+
+/**
+ * An in-memory stand-in for the Redis commands redisHelper uses. Strings and
+ * Buffers are stored as they are, sorted sets as arrays in score order and
+ * hashes as objects.
+ */
+function fakeClient(store) {
+    return {
+        on: jest.fn(),
+        connect: jest.fn(async () => {}),
+        quit: jest.fn(async () => {}),
+        get: jest.fn(async (key) => store[key] ?? null),
+        mGet: jest.fn(async (options, keys) => keys.map((key) => store[key] ?? null)),
+        exists: jest.fn(async (key) => (key in store ? 1 : 0)),
+        keys: jest.fn(async () => Object.keys(store).filter((key) => key.includes('@'))),
+        zRange: jest.fn(async (key, start, stop) => (store[key] ?? []).slice(start, stop < 0 ? undefined : stop + 1)),
+        zCard: jest.fn(async (key) => (store[key] ?? []).length),
+        hmGet: jest.fn(async (key, fields) => fields.map((field) => store[key]?.[field] ?? null)),
+    };
+}
+
+let store;
+
+/** The keys read with GET by the clients created so far. */
+function keysRead() {
+    return createClient.mock.results.flatMap(({ value }) => value.get.mock.calls.map(([key]) => key));
+}
+
+beforeEach(() => {
+    store = {};
+    createClient.mockImplementation(() => fakeClient(store));
+});
+
+afterEach(() => {
+    jest.clearAllMocks();
+});
+
+describe('getStudents', () => {
+    beforeEach(() => {
+        store['Roster'] = ['a@berkeley.edu', 'b@berkeley.edu', 'c@berkeley.edu'];
+        store['Roster Names'] = { 'a@berkeley.edu': 'Ada', 'b@berkeley.edu': 'Bo', 'c@berkeley.edu': 'Cy' };
+    });
+
+    test('should return the whole roster in order by default', async () => {
+        expect(await getStudents()).toEqual([
+            ['Ada', 'a@berkeley.edu'],
+            ['Bo', 'b@berkeley.edu'],
+            ['Cy', 'c@berkeley.edu'],
+        ]);
+    });
+
+    test('should return at most limit students from offset', async () => {
+        expect(await getStudents(1, 1)).toEqual([['Bo', 'b@berkeley.edu']]);
+        expect(await getStudents(1, 5)).toEqual([['Bo', 'b@berkeley.edu'], ['Cy', 'c@berkeley.edu']]);
+    });
+
+    test('should return the rest of the roster for a limit of -1', async () => {
+        expect(await getStudents(2, -1)).toEqual([['Cy', 'c@berkeley.edu']]);
+    });
+
+    test('should return no students for a limit of 0 without reading Redis', async () => {
+        expect(await getStudents(0, 0)).toEqual([]);
+        expect(await getStudents(1, 0)).toEqual([]);
+        expect(createClient).not.toHaveBeenCalled();
+    });
+
+    test('should return no students for an offset past the end', async () => {
+        expect(await getStudents(3, 2)).toEqual([]);
+        expect(await getStudents(5)).toEqual([]);
+    });
+
+    test('should page the student keys when there is no roster index', async () => {
+        store = {
+            'a@berkeley.edu': JSON.stringify({ 'Legal Name': 'Ada' }),
+            'b@berkeley.edu': JSON.stringify({ 'Legal Name': 'Bo' }),
+            'Categories': JSON.stringify({}),
+        };
+        expect(await getStudents()).toEqual([['Ada', 'a@berkeley.edu'], ['Bo', 'b@berkeley.edu']]);
+        expect(await getStudents(1, 1)).toEqual([['Bo', 'b@berkeley.edu']]);
+        expect(await getStudents(0, 0)).toEqual([]);
+    });
+});
+
+describe('getStudentCount', () => {
+    test('should count the roster index', async () => {
+        store['Roster'] = ['a@berkeley.edu', 'b@berkeley.edu'];
+        store['c@berkeley.edu'] = JSON.stringify({ 'Legal Name': 'Cy' }); // not on the roster
+        expect(await getStudentCount()).toBe(2);
+    });
+
+    test('should count the student keys when there is no roster index', async () => {
+        store['a@berkeley.edu'] = JSON.stringify({ 'Legal Name': 'Ada' });
+        store['Categories'] = JSON.stringify({});
+        expect(await getStudentCount()).toBe(1);
+    });
+});
+
+describe('getStudent', () => {
+    const schema = (version) => ({
+        version,
+        columns: [['Labs', 'Lab 1'], ['Labs', 'Lab 2'], ['Projects', 'Project 1']],
+        sections: ['Labs', 'Projects'],
+    });
+    const positional = (version) => JSON.stringify([version, 'Ada', [9, 7.5, null], [16.5, 0], 16.5, 'B']);
+
+    test('should return a keyed record unchanged', async () => {
+        const record = { 'Legal Name': 'Ada', 'Assignments': { 'Labs': { 'Lab 1': 9 } } };
+        store['a@berkeley.edu'] = JSON.stringify(record);
+        expect(await getStudent('a@berkeley.edu')).toEqual(record);
+        expect(keysRead()).toEqual(['a@berkeley.edu']);
+    });
+
+    test('should decode a positional record against the stored schema', async () => {
+        store['Student Schema'] = JSON.stringify(schema('v1'));
+        store['a@berkeley.edu'] = positional('v1');
+        expect(await getStudent('a@berkeley.edu')).toEqual({
+            'Legal Name': 'Ada',
+            'Assignments': { 'Labs': { 'Lab 1': 9, 'Lab 2': 7.5 }, 'Projects': { 'Project 1': null } },
+            'Aggregates': { 'Section Totals': { 'Labs': 16.5, 'Projects': 0 }, 'Total': 16.5, 'Grade': 'B' },
+        });
+    });
+
+    test('should read the schema once per version', async () => {
+        store['Student Schema'] = JSON.stringify(schema('v2'));
+        store['a@berkeley.edu'] = positional('v2');
+        await getStudent('a@berkeley.edu');
+        await getStudent('a@berkeley.edu');
+        expect(keysRead().filter((key) => key === 'Student Schema')).toEqual(['Student Schema']);
+    });
+
+    test('should re-read the schema when a record names a new version', async () => {
+        store['Student Schema'] = JSON.stringify(schema('v3'));
+        store['a@berkeley.edu'] = positional('v3');
+        await getStudent('a@berkeley.edu');
+
+        store['Student Schema'] = JSON.stringify({ ...schema('v4'), columns: [['Labs', 'Lab 3'], ['Labs', 'Lab 1'], ['Projects', 'Project 1']] });
+        store['a@berkeley.edu'] = positional('v4');
+        const student = await getStudent('a@berkeley.edu');
+        expect(student['Assignments']['Labs']).toEqual({ 'Lab 3': 9, 'Lab 1': 7.5 });
+        expect(keysRead().filter((key) => key === 'Student Schema').length).toBe(2);
+    });
+
+    test('should reject a record whose version is not the stored schema', async () => {
+        store['Student Schema'] = JSON.stringify(schema('v5'));
+        store['a@berkeley.edu'] = positional('v6');
+        await expect(getStudent('a@berkeley.edu')).rejects.toThrow('schema version v6, but v5 is stored');
+    });
+});
+
+describe('getDistributionScores', () => {
+    /** A matrix encoded the way numpy.save writes it, as dbcron/columnar.py publishes it. */
+    function npy(rows, cols, values, { version = 1, descr = '<f4' } = {}) {
+        const preamble = version === 1 ? 10 : 12;
+        let header = `{'descr': '${descr}', 'fortran_order': False, 'shape': (${rows}, ${cols}), }`;
+        header = header.padEnd(Math.ceil((preamble + header.length + 1) / 64) * 64 - preamble - 1) + '\n';
+        const magic = Buffer.alloc(preamble);
+        magic.write('\x93NUMPY', 'latin1');
+        magic[6] = version;
+        if (version === 1) {
+            magic.writeUInt16LE(header.length, 8);
+        } else {
+            magic.writeUInt32LE(header.length, 8);
+        }
+        return Buffer.concat([magic, Buffer.from(header, 'latin1'), Buffer.from(new Float32Array(values).buffer)]);
+    }
+
+    beforeEach(() => {
+        store['Score Matrix Index'] = JSON.stringify({
+            emails: ['a@berkeley.edu', 'b@berkeley.edu', 'c@berkeley.edu'],
+            columns: [['Labs', 'Lab 1'], ['Labs', 'Lab 2']],
+        });
+        store['Roster Names'] = { 'a@berkeley.edu': 'Ada', 'b@berkeley.edu': 'Bo', 'c@berkeley.edu': 'Cy' };
+    });
+
+    test('should read an assignment column of the float32 matrix, skipping NaN', async () => {
+        store['Score Matrix'] = npy(3, 2, [0.1, 10, NaN, 8, 7.3, NaN]);
+        expect(await getDistributionScores('Labs', 'Lab 1')).toEqual([
+            { studentName: 'Ada', studentEmail: 'a@berkeley.edu', score: 0.1 },
+            { studentName: 'Cy', studentEmail: 'c@berkeley.edu', score: 7.3 },
+        ]);
+        expect(await getDistributionScores('Labs', 'Lab 2')).toEqual([
+            { studentName: 'Ada', studentEmail: 'a@berkeley.edu', score: 10 },
+            { studentName: 'Bo', studentEmail: 'b@berkeley.edu', score: 8 },
+        ]);
+    });
+
+    test('should read a version 2 header and an unaligned buffer', async () => {
+        const blob = npy(3, 2, [1, 2, 3, 4, 5, 6], { version: 2 });
+        store['Score Matrix'] = Buffer.concat([Buffer.alloc(1), blob]).subarray(1);
+        const scores = await getDistributionScores('Labs', 'Lab 2');
+        expect(scores.map(({ score }) => score)).toEqual([2, 4, 6]);
+    });
+
+    test('should return no scores for an assignment missing from the matrix', async () => {
+        store['Score Matrix'] = npy(3, 2, [1, 2, 3, 4, 5, 6]);
+        expect(await getDistributionScores('Labs', 'Lab 9')).toEqual([]);
+    });
+
+    test('should return null before the matrix is published', async () => {
+        expect(await getDistributionScores('Labs', 'Lab 1')).toBeNull();
+    });
+
+    test('should reject a matrix that is not float32', async () => {
+        store['Score Matrix'] = npy(3, 2, [1, 2, 3, 4, 5, 6], { descr: '<f8' });
+        await expect(getDistributionScores('Labs', 'Lab 1')).rejects.toThrow('Unsupported Score Matrix layout');
+    });
+
+    test('should reject a blob that is not in .npy format', async () => {
+        store['Score Matrix'] = Buffer.from('not a matrix');
+        await expect(getDistributionScores('Labs', 'Lab 1')).rejects.toThrow('not in .npy format');
+    });
+});
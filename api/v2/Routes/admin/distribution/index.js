@@ -1,85 +1,34 @@
 import { Router } from 'express';
-import { getStudents, getStudentScores } from '../../../../lib/redisHelper.mjs'; 
+import { getAssignmentStats, getMaxScores, isStatsPublished } from '../../../../lib/redisHelper.mjs';
 const router = Router({ mergeParams: true });
 
+// Like dbcron's MAX_HISTOGRAM_BUCKETS, beyond which its histograms are clipped
+const MAX_BUCKETS = 1000;
+
 /**
  * GET /admin/distribution/:section/:name
- * Returns score distribution with student data.
+ * Returns the score distribution, from the 1-point histogram dbcron precomputes
+ * in the "Stats" hash at sync time. The students of a bucket are listed by
+ * GET /admin/studentScores/:section/:assignment/:score when it is selected.
  * Returns: { 
  *   freq: [count0, count1, ...], 
  *   minScore: number, 
  *   maxScore: number,
  *   binWidth: number,
- *   distribution: [{ range: "50-74", count: N, students: [{name, email, score}, ...] }, ...]
+ *   distribution: [{ range: "50", rangeStart: 50, rangeEnd: 50, count: N }, ...]
  * }
+ * Answers 503 with stale: true until a sync has computed the statistics.
  */
 router.get('/:section/:name', async (req, res) => {
     try {
         const { section, name } = req.params;
-        const students = await getStudents();
-        
-        // Get max possible score for this assignment
-        const { getMaxScores } = await import('../../../../lib/redisHelper.mjs');
-        const maxScoresData = await getMaxScores();
-        let maxPossibleScore = null;
-        
-        if (!name.includes('Summary') && maxScoresData[section] && maxScoresData[section][name]) {
-            maxPossibleScore = Number(maxScoresData[section][name]);
-        } 
 
-        let scoreData; // Array of {studentName, studentEmail, score}
-        
-        // Check if this is a summary request
-        if (name.includes('Summary')) {
-            // Get sum of all assignments in this section for each student
-            scoreData = [];
-            for (const student of students) {
-                const studentId = student[1]; 
-                const studentScores = await getStudentScores(studentId); 
-                
-                if (!studentScores[section]) {
-                    continue;
-                }
-                
-                const sectionScores = studentScores[section];
-                let total = 0;
-                let count = 0;
-                
-                Object.values(sectionScores).forEach(score => {
-                    if (score != null && score !== '' && !isNaN(score)) {
-                        total += Number(score);
-                        count++;
-                    }
-                });
-                
-                if (count > 0) {
-                    scoreData.push({
-                        studentName: student[0],
-                        studentEmail: student[1],
-                        score: total
-                    });
-                }
-            }
-        } else {
-            // Get score for a specific assignment
-            scoreData = [];
-            for (const student of students) {
-                const studentId = student[1]; 
-                const studentScores = await getStudentScores(studentId); 
-                
-                const score = studentScores[section] ? studentScores[section][name] : null;
-                
-                if (score != null && score !== '' && !isNaN(score)) {
-                    scoreData.push({
-                        studentName: student[0],
-                        studentEmail: student[1],
-                        score: Number(score)
-                    });
-                }
-            }
+        const stats = await getAssignmentStats(section, name);
+        if (!stats && !await isStatsPublished()) {
+            return res.status(503).json({ error: 'Distribution has not been computed yet; try again after the next sync', stale: true });
         }
 
-        if (scoreData.length === 0) {
+        if (!stats || stats.count === 0) {
             // Return empty data structure
             return res.json({ 
                 freq: [], 
@@ -90,49 +39,38 @@ router.get('/:section/:name', async (req, res) => {
             });
         }
 
-        const scores = scoreData.map(d => d.score);
-        const maxScore = Math.max(...scores);
-        const minScore = Math.min(...scores);
+        // Get max possible score for this assignment
+        const maxScoresData = await getMaxScores();
+        let maxPossibleScore = null;
         
-        // --- Logic for binning: Always use 1-point bins for accuracy ---
-        const range = maxScore - minScore;
+        if (!name.includes('Summary') && maxScoresData[section] && maxScoresData[section][name]) {
+            maxPossibleScore = Number(maxScoresData[section][name]);
+        } 
+
+        const { min: minScore, max: maxScore, count } = stats;
         const isSummary = name.includes('Summary');
-        
-        // Validate range
-        if (!isFinite(range) || range < 0) {
-            console.error('Invalid range calculation:', { minScore, maxScore, range });
-            return res.status(500).json({ 
-                error: 'Invalid score range',
-                details: { minScore, maxScore, range }
-            });
-        }
-        
+
         // Handle case where all scores are the same
-        if (range === 0) {
+        if (minScore === maxScore) {
             return res.json({
-                freq: [scoreData.length],
+                freq: [count],
                 minScore,
                 maxScore,
                 binWidth: 1,
-                totalStudents: scoreData.length,
+                totalStudents: count,
                 isSummary,
                 suggestedTickInterval: 1,
                 distribution: [{
                     range: `${minScore}`,
                     rangeStart: minScore,
                     rangeEnd: minScore,
-                    count: scoreData.length,
-                    students: scoreData.map(d => ({
-                        name: d.studentName,
-                        email: d.studentEmail,
-                        score: d.score
-                    }))
+                    count
                 }]
             });
         }
         
-        // Always use 1-point bins for data accuracy
-        const binWidth = 1;
+        // The histogram's bins are 1 point wide, starting from 0
+        const binWidth = stats.histogram.binWidth;
         
         // Determine the actual range to use (0 to maxPossibleScore if available)
         const displayMinScore = 0;
@@ -151,56 +89,30 @@ router.get('/:section/:name', async (req, res) => {
             suggestedTickInterval = 2;
         }
         
-        // Additional validation before creating arrays
-        if (numBuckets > 1000) {
+        if (numBuckets > MAX_BUCKETS) {
             console.error('Too many buckets requested:', numBuckets);
             return res.status(500).json({ 
                 error: 'Score range too large',
-                details: { minScore, maxScore, range, numBuckets }
+                details: { minScore, maxScore, range: maxScore - minScore, numBuckets }
             });
         }
         
-        // Initialize frequency array and distribution map
-        // Fill from 0 to displayMaxScore
+        // Pad the histogram out to displayMaxScore; scores above it count in the last bucket
         const freq = Array(numBuckets).fill(0);
-        const distributionBuckets = Array(numBuckets).fill(null).map(() => ({
-            students: []
-        }));
-        
-        // Group students by bucket
-        scoreData.forEach(data => {
-            const score = data.score;
-            // Calculate which bucket this score falls into (from 0)
-            let bucketIndex = Math.floor(score / binWidth);
-            
-            // Handle edge case where score equals or exceeds displayMaxScore
-            if (bucketIndex >= numBuckets) {
-                bucketIndex = numBuckets - 1;
-            }
-            
-            freq[bucketIndex]++;
-            distributionBuckets[bucketIndex].students.push({
-                name: data.studentName,
-                email: data.studentEmail,
-                score: data.score
-            });
+        stats.histogram.freq.forEach((bucketCount, index) => {
+            freq[Math.min(index, numBuckets - 1)] += bucketCount;
         });
         
-        // Convert distribution buckets to array with range labels
-        // Start from 0 and go to displayMaxScore
-        const distribution = distributionBuckets.map((bucket, index) => {
+        const distribution = freq.map((bucketCount, index) => {
             const scoreValue = index * binWidth;
             
             return {
                 range: `${scoreValue}`,
                 rangeStart: scoreValue,
                 rangeEnd: scoreValue,
-                count: bucket.students.length,
-                students: bucket.students
+                count: bucketCount
             };
         });
-        
-        // --- END Logic for binning ---
 
         res.json({
             freq,
@@ -210,10 +122,10 @@ router.get('/:section/:name', async (req, res) => {
             actualMaxScore: maxScore,   // Actual highest student score
             maxPossibleScore,           // Max possible score for this assignment (null for summary)
             binWidth,
-            totalStudents: scoreData.length,
+            totalStudents: count,
             isSummary,
             suggestedTickInterval,  // Frontend can use this to reduce x-axis label density
-            distribution  // Includes all students grouped by score range (0 to maxScore)
+            distribution  // Counts per score from 0 to maxScore
         });
     } catch (error) {
         console.error('Error fetching frequency distribution:', error);
@@ -221,4 +133,4 @@ router.get('/:section/:name', async (req, res) => {
     }
 });
 
-export default router;
\ No newline at end of file
+export default router;
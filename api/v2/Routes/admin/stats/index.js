@@ -1,5 +1,5 @@
 import { Router } from 'express';
-import { getStudentScores, getStudents } from '../../../../lib/redisHelper.mjs';
+import { getAssignmentStats, isStatsPublished } from '../../../../lib/redisHelper.mjs';
 const router = Router({ mergeParams: true });
 
 /**
@@ -10,81 +10,21 @@ const router = Router({ mergeParams: true });
 router.get('/:section/:name', async (req, res) => {
     try {
         const { section, name } = req.params;
-        const students = await getStudents();
-        
-        let scorePromises;
-        
-        // Check if this is a summary request
-        if (name.includes('Summary')) {
-            // Get all assignments in this section and sum their scores
-            scorePromises = students.map(async student => {
-                const studentId = student[1];
-                const studentScores = await getStudentScores(studentId);
-                
-                if (!studentScores[section]) {
-                    return null;
-                }
-                
-                const sectionScores = studentScores[section];
-                let total = 0;
-                let count = 0;
-                
-                Object.values(sectionScores).forEach(score => {
-                    if (score != null && score !== '' && !isNaN(score)) {
-                        total += Number(score);
-                        count++;
-                    }
-                });
-                
-                return count > 0 ? total : null;
-            });
-        } else {
-            // Original logic: get stats for a specific assignment
-            scorePromises = students.map(async student => {
-                const studentId = student[1];
-                const studentScores = await getStudentScores(studentId);
-                const score = studentScores[section] ? studentScores[section][name] : null;
-            
 
-                if (score != null && score !== '') {
-                    return Number(score);
-                }
-                return null; 
-            });
+        // Precomputed by dbcron at sync time
+        const precomputed = await getAssignmentStats(section, name);
+        if (!precomputed && !await isStatsPublished()) {
+            return res.status(503).json({ error: 'Statistics have not been computed yet; try again after the next sync', stale: true });
         }
-
-        const rawScores = await Promise.all(scorePromises);
-
-        const scores = rawScores.filter(score => score !== null);
-
-        if (scores.length === 0) {
-            return res.json({
-                average: 0,
-                max: 0,
-                min: 0,
-                count: 0,
-                median: 0
-            });
+        if (!precomputed || precomputed.count === 0) {
+            return res.json({ average: 0, max: 0, min: 0, count: 0, median: 0 });
         }
-
-        const sum = scores.reduce((a, b) => a + b, 0);
-
-        const average = sum / scores.length;
-        const max = Math.max(...scores);
-        const min = Math.min(...scores);
-        
-        const sorted = [...scores].sort((a, b) => a - b); 
-        
-        const median = sorted.length % 2 === 0
-            ? (sorted[sorted.length / 2 - 1] + sorted[sorted.length / 2]) / 2
-            : sorted[Math.floor(sorted.length / 2)];
-
         res.json({
-            average: parseFloat(average.toFixed(2)),
-            max,
-            min,
-            median: parseFloat(median.toFixed(2)),
-            count: scores.length
+            average: parseFloat(precomputed.average.toFixed(2)),
+            max: precomputed.max,
+            min: precomputed.min,
+            median: parseFloat(precomputed.median.toFixed(2)),
+            count: precomputed.count
         });
     } catch (error) {
         console.error('Error fetching stats:', error);
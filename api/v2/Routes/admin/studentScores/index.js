@@ -1,15 +1,27 @@
 import { Router } from 'express';
-import { getStudents, getStudentScores, getStudentsByAssignmentScore } from '../../../../lib/redisHelper.mjs'; 
+import { getDistributionScores, getStudentCount, getStudents, getStudentScores } from '../../../../lib/redisHelper.mjs'; 
 
 const router = Router({ mergeParams: true });
 
 /**
- * GET /admin/student-scores
- * Returns all student scores in the format expected by admin.jsx
+ * GET /admin/student-scores?offset=0&limit=50
+ * Returns student scores in the format expected by admin.jsx, in gradebook order.
+ * offset and limit are optional non-negative integers (400 otherwise); without
+ * a limit every student is returned, and limit=0 returns none.
+ * Returns: { students: [...], total }
  */
 router.get('/', async (req, res) => {
     try {
-        const students = await getStudents();
+        const { offset: rawOffset = '0', limit: rawLimit } = req.query;
+        if (!/^\d+$/.test(rawOffset) || (rawLimit !== undefined && !/^\d+$/.test(rawLimit))) {
+            return res.status(400).json({
+                error: 'offset and limit must be non-negative integers',
+                students: []
+            });
+        }
+        const offset = Number(rawOffset);
+        const limit = rawLimit !== undefined ? Number(rawLimit) : -1;
+        const [students, total] = await Promise.all([getStudents(offset, limit), getStudentCount()]);
 
         const studentDataPromises = students.map(async (student) => {
             const studentId = student[1]; 
@@ -26,7 +38,8 @@ router.get('/', async (req, res) => {
         const formattedStudents = await Promise.all(studentDataPromises);
 
         res.json({
-            students: formattedStudents
+            students: formattedStudents,
+            total
         });
     } catch (error) {
         console.error('Error fetching student scores:', error);
@@ -38,10 +51,12 @@ router.get('/', async (req, res) => {
 });
 
 /**
- * GET /admin/students-by-score/:section/:assignment/:score
+ * GET /admin/studentScores/:section/:assignment/:score
  * Returns students who achieved the specified score on the assignment.
- * Score can be a range (e.g., "50-74") or a single value.
- * This endpoint now caches distribution data internally to avoid re-traversal.
+ * Score can be a range (e.g., "50-74") or a single value; a score matches
+ * when its whole-point bucket, as /admin/distribution bins it, is in range.
+ * Reads the score matrix (or section totals) dbcron publishes in one go, and
+ * answers 503 with stale: true until a sync has published it.
  */
 router.get('/:section/:assignment/:score', async (req, res) => {
     const { section, assignment, score } = req.params;
@@ -63,63 +78,22 @@ router.get('/:section/:assignment/:score', async (req, res) => {
     }
 
     try {
-        // Get distribution data which already has all students grouped by score
-        const students = await getStudents();
-        
-        // Check if this is a Summary request
-        if (decodedAssignment.includes('Summary')) {
-            // Get sum of all assignments in this section for each student
-            const matchingStudents = [];
-            
-            for (const student of students) {
-                const studentEmail = student[1];
-                const studentName = student[0];
-                const studentScores = await getStudentScores(studentEmail);
-
-                // Sum all scores in this section
-                let sectionTotal = 0;
-                if (studentScores[decodedSection]) {
-                    Object.values(studentScores[decodedSection]).forEach(score => {
-                        if (score != null && score !== '') {
-                            sectionTotal += parseInt(score) || 0;
-                        }
-                    });
-                }
-
-                // Check if this student's total falls within the score range
-                if (sectionTotal >= minScore && sectionTotal <= maxScore) {
-                    matchingStudents.push({
-                        name: studentName,
-                        email: studentEmail,
-                        score: sectionTotal
-                    });
-                }
-            }
-
-            return res.json({ students: matchingStudents });
+        const scoreData = await getDistributionScores(decodedSection, decodedAssignment);
+        if (scoreData === null) {
+            return res.status(503).json({
+                error: 'Scores have not been published yet; try again after the next sync',
+                stale: true,
+                students: []
+            });
         }
 
-        // Regular assignment score lookup - check range
-        const matchingStudents = [];
-
-        for (const student of students) {
-            const studentEmail = student[1];
-            const studentName = student[0];
-            const studentScores = await getStudentScores(studentEmail);
-            const studentScore = studentScores[decodedSection] ? studentScores[decodedSection][decodedAssignment] : null;
-
-            if (studentScore != null && studentScore !== '') {
-                const scoreVal = parseInt(studentScore) || 0;
-                // Check if score falls within the range
-                if (scoreVal >= minScore && scoreVal <= maxScore) {
-                    matchingStudents.push({
-                        name: studentName,
-                        email: studentEmail,
-                        score: scoreVal
-                    });
-                }
-            }
-        }
+        const matchingStudents = scoreData
+            .filter(({ score: studentScore }) => Math.floor(studentScore) >= minScore && Math.floor(studentScore) <= maxScore)
+            .map(({ studentName, studentEmail, score: studentScore }) => ({
+                name: studentName,
+                email: studentEmail,
+                score: studentScore
+            }));
 
         res.json({ students: matchingStudents });
     } catch (error) {
@@ -131,5 +105,4 @@ router.get('/:section/:assignment/:score', async (req, res) => {
     }
 });
 
-
 export default router;
\ No newline at end of file
@@ -0,0 +1,64 @@
+"""
+Per-student aggregates computed once per sync.
+
+The admin stats and distribution routes used to re-sum every student's section
+scores on every request. update_redis now stores the sums next to the raw
+"Assignments" blob, under "Aggregates":
+
+    "Aggregates": {
+        "Section Totals": {"Quest": 27, "Labs": null, ...},
+        "Total": 27,
+        "Grade": "C+"
+    }
+
+A section total is null when the student has no numeric score in that section,
+matching the routes' "count > 0 ? total : null" rule. "Grade" is null when
+there are no bins, or only the fallback bins update_bins stores when the
+Constants sheet has none (those are percentages, not point totals).
+"""
+import math
+
+
+def is_score(value):
+    """
+    True for finite numeric cells; blanks and text such as "N/A" are not
+    scores, nor are the NaN and infinite floats gspread makes of cells like
+    "NaN", "inf" or "1e400", or integers too large to be stored as a float.
+    """
+    if not isinstance(value, (int, float)) or isinstance(value, bool):
+        return False
+    try:
+        return math.isfinite(value)
+    except OverflowError:  # an int beyond float range
+        return False
+
+
+def letter_grade(total, bins):
+    """
+    Maps a point total to a letter using the bins stored by update_bins. Each
+    bin's points is the inclusive upper bound of its letter, as laid out on the
+    Constants sheet; the bins are sorted here rather than trusted to be stored
+    ascending, and totals above the last bound get the top letter. Returns None
+    when there are no bins.
+    """
+    if not bins:
+        return None
+    ordered = sorted(bins, key=lambda grade_bin: grade_bin["points"])
+    for grade_bin in ordered:
+        if total <= grade_bin["points"]:
+            return grade_bin["letter"]
+    return ordered[-1]["letter"]
+
+
+def student_aggregates(assignments, bins):
+    """Computes the "Aggregates" entry for one student's "Assignments" dict."""
+    section_totals = {}
+    for category, scores in assignments.items():
+        numeric = [score for score in scores.values() if is_score(score)]
+        section_totals[category] = sum(numeric) if numeric else None
+    total = sum(score for score in section_totals.values() if score is not None)
+    return {
+        "Section Totals": section_totals,
+        "Total": total,
+        "Grade": letter_grade(total, bins),
+    }
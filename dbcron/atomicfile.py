@@ -0,0 +1,24 @@
+"""
+Atomic file replacement for the files dbcron writes for other processes to
+read (the Prometheus textfiles in metrics.py, the score matrix files in
+columnar.py): the data is written to a temporary file in the same directory
+and renamed over the target, so a reader never sees a partial file.
+"""
+import os
+import tempfile
+
+
+def replace_file(path, data):
+    """Replaces path with data (bytes, or str written as UTF-8), creating its directory if needed."""
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as tmp_file:
+            tmp_file.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
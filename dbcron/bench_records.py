@@ -0,0 +1,86 @@
+"""
+Compares the student record encodings in records.py on a synthetic class:
+bytes stored per student and the time to decode every record. With --redis,
+the records are also written to that Redis DB (which is flushed first) and
+MEMORY USAGE is reported per key.
+
+    python bench_records.py --students 1500 --assignments 80
+"""
+import argparse
+import random
+import statistics
+import time
+
+import redis
+
+from aggregates import student_aggregates
+from records import STUDENT_ENCODINGS, StudentSchema, decode_student, encode_student
+
+BINS = [{"letter": letter, "points": points} for letter, points in [("F", 599), ("D", 699), ("C", 799), ("B", 899), ("A", 1000)]]
+
+
+def synthetic_class(num_students, num_assignments, seed=0):
+    """Builds (schema, records) shaped like update_redis's student records."""
+    rng = random.Random(seed)
+    sections = ["Quest", "Midterm", "Postterm", "Labs", "Projects", "Participation"]
+    columns = [(sections[i % len(sections)], f"Assignment {i + 1}") for i in range(num_assignments)]
+    records = []
+    for i in range(num_students):
+        assignments = {}
+        for category, concept in columns:
+            score = rng.choice(["", "N/A"]) if rng.random() < 0.05 else round(rng.uniform(0, 10), rng.choice([0, 1]))
+            assignments.setdefault(category, {})[concept] = score
+        records.append({
+            "Legal Name": f"Student {i:05d}",
+            "Assignments": assignments,
+            "Aggregates": student_aggregates(assignments, BINS),
+        })
+    return StudentSchema(columns), records
+
+
+def timed(func, repeat):
+    runs = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        runs.append(time.perf_counter() - started)
+    return statistics.median(runs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--students", type=int, default=1500)
+    parser.add_argument("--assignments", type=int, default=80)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--redis", metavar="URL", help="e.g. redis://localhost:6379/15 (FLUSHED)")
+    args = parser.parse_args()
+
+    schema, records = synthetic_class(args.students, args.assignments)
+    redis_client = redis.Redis.from_url(args.redis) if args.redis else None
+    print(f"{args.students} students x {args.assignments} assignments, median of {args.repeat} runs")
+    print(f"{'encoding':<12}{'bytes/student':>15}{'encode ms':>12}{'decode ms':>12}{'redis bytes/key':>17}")
+
+    for encoding in STUDENT_ENCODINGS:
+        encoded = [encode_student(record, schema, encoding) for record in records]
+        assert all(decode_student(value, schema) == record for value, record in zip(encoded, records))
+        encode_time = timed(lambda: [encode_student(record, schema, encoding) for record in records], args.repeat)
+        decode_time = timed(lambda: [decode_student(value, schema) for value in encoded], args.repeat)
+
+        memory = ""
+        if redis_client is not None:
+            redis_client.flushdb()
+            pipeline = redis_client.pipeline(transaction=False)
+            for i, value in enumerate(encoded):
+                pipeline.set(f"student{i}@example.edu", value)
+            pipeline.execute()
+            pipeline = redis_client.pipeline(transaction=False)
+            for i in range(len(encoded)):
+                pipeline.memory_usage(f"student{i}@example.edu")
+            memory = f"{statistics.mean(pipeline.execute()):.0f}"
+
+        size = statistics.mean(len(value.encode("utf-8")) for value in encoded)
+        print(f"{encoding:<12}{size:>15.0f}{encode_time * 1000:>12.1f}{decode_time * 1000:>12.1f}{memory:>17}")
+
+
+if __name__ == "__main__":
+    main()
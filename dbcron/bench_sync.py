@@ -0,0 +1,316 @@
+"""
+End-to-end benchmark of the dbcron sync jobs on synthetic gradebooks.
+
+Each scenario runs update_bins and update_redis, unmodified, in a fresh
+process. They read a generated spreadsheet from an in-memory stand-in for
+the gspread client, and write to fakeredis (the default) or to a real Redis
+given with --redis. DBs 14 and 15 of that server are FLUSHED. fakeredis is
+not a dependency of the jobs; install it with the dev requirements first:
+
+    pip install -r requirements-dev.txt
+
+Phases per scenario:
+    fetch_bins, commit_bins          bins download and write
+    fetch_gradebook                  gradebook download (one get_all_values, or the
+                                     header rows only with --chunk-rows)
+    commit_gradebook                 cold sync: every key is new
+    commit_unchanged                 resync of identical data: nothing to write
+    commit_changed                   resync after 1% of the scores changed
+
+Reported per phase: wall time, Redis round trips, bytes sent to Redis, Sheets
+calls and peak RSS. --chunk-rows N runs the sync in streaming mode
+(GRADEBOOK_CHUNK_ROWS=N), where the commit phases read the rows themselves.
+
+    python bench_sync.py --students 100,1000,5000 --assignments 50,200
+    python bench_sync.py --students 20000 --assignments 500 --redis redis://localhost:6379 --json
+    python bench_sync.py --students 20000 --assignments 500 --chunk-rows 1000
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import threading
+import time
+
+BENCH_ENV = {
+    "SERVER_PORT": "6379",
+    "SERVER_HOST": "localhost",
+    "SERVER_DBINDEX": "14",
+    "BINS_DBINDEX": "15",
+    "SPREADSHEET_SCOPES": "[]",
+    "SERVICE_ACCOUNT_CREDENTIALS": "{}",
+    "SPREADSHEET_ID": "bench",
+    "SPREADSHEET_SHEETNAME": "Gradebook",
+    "SPREADSHEET_WORKSHEET": "0",
+    "BINS_WORKSHEET": "1",
+    "ASSIGNMENT_CONCEPTSROW": "1",
+    "ASSIGNMENT_CONCEPTSCOL": "2",
+    "ASSIGNMENT_CATEGORYROW": "2",
+    "ASSIGNMENT_CATEGORYCOL": "2",
+    "ASSIGNMENT_MAXPOINTSROW": "3",
+    "ASSIGNMENT_MAXPOINTSCOL": "2",
+    "REDIS_DB_SECRET": "",
+}
+PHASES = ["fetch_bins", "commit_bins", "fetch_gradebook", "commit_gradebook", "commit_unchanged", "commit_changed"]
+LETTERS = ["F", "D-", "D", "D+", "C-", "C", "C+", "B-", "B", "B+", "A-", "A"]
+
+
+def synthetic_gradebook(num_students, num_assignments, num_categories, seed=0):
+    """
+    Generates the gradebook worksheet (as get_all_values returns it) and the
+    Constants worksheet rows. Categories are contiguous blocks of assignments;
+    about 3% of scores are blank and 0.5% are text.
+    """
+    rng = random.Random(seed)
+    categories = [f"Category {i + 1}" for i in range(num_categories)]
+    columns = [(categories[i * num_categories // num_assignments], f"Assignment {i + 1}") for i in range(num_assignments)]
+    max_points = [rng.choice([5, 10, 20, 50, 100]) for _ in columns]
+
+    values = [
+        ["Legal Name", "Email"] + [concept for _, concept in columns],
+        ["", "CATEGORY"] + [category for category, _ in columns],
+        ["MAX POINTS", "MAX POINTS"] + [str(points) for points in max_points],
+    ]
+    for i in range(num_students):
+        row = [f"Student {i:05d}", f"student{i:05d}@berkeley.edu"]
+        for points in max_points:
+            roll = rng.random()
+            if roll < 0.03:
+                row.append("")
+            elif roll < 0.035:
+                row.append("Excused")
+            else:
+                row.append(str(round(rng.uniform(0.4, 1) * points, rng.choice([0, 1]))))
+        values.append(row)
+
+    total = sum(max_points)
+    constants = [[] for _ in range(61)]
+    for i, category in enumerate(categories[:35]):
+        category_total = sum(p for (c, _), p in zip(columns, max_points) if c == category)
+        constants[15 + i] = [category, str(category_total)]
+    for i, letter in enumerate(LETTERS[:11]):
+        constants[50 + i] = [str(round(total * (0.5 + 0.05 * i))), letter]
+    return values, constants
+
+
+class SyntheticWorksheet:
+    def __init__(self, rows, counter):
+        self.rows = rows
+        self.counter = counter
+
+    def get_all_values(self, *args, **kwargs):
+        self.counter["sheets_calls"] += 1
+        width = max((len(row) for row in self.rows), default=0)
+        return [list(row) + [""] * (width - len(row)) for row in self.rows]
+
+    @property
+    def row_count(self):
+        return len(self.rows)
+
+    def _range(self, a1_range):
+        """The cells of an A1 range, with trailing empty cells and rows dropped like the API does."""
+        from gspread.utils import a1_to_rowcol
+
+        start, end = a1_range.split(":")
+        if start.isdigit():  # whole rows, e.g. "1:3"
+            (first_row, first_col), (last_row, last_col) = (int(start), 1), (int(end), None)
+        else:
+            (first_row, first_col), (last_row, last_col) = a1_to_rowcol(start), a1_to_rowcol(end)
+        rows = [list(self.rows[r - 1][first_col - 1:last_col]) if r <= len(self.rows) else []
+                for r in range(first_row, last_row + 1)]
+        for row in rows:
+            while row and row[-1] == "":
+                row.pop()
+        while rows and not rows[-1]:
+            rows.pop()
+        return rows
+
+    def get_values(self, a1_range, **kwargs):
+        self.counter["sheets_calls"] += 1
+        rows = self._range(a1_range)
+        width = max((len(row) for row in rows), default=0)
+        return [row + [""] * (width - len(row)) for row in rows]
+
+    def batch_get(self, ranges, **kwargs):
+        self.counter["sheets_calls"] += 1
+        return [self._range(a1_range) for a1_range in ranges]
+
+
+class SyntheticClient:
+    """The subset of the gspread client the sync jobs use."""
+
+    def __init__(self, values, constants):
+        self.counter = {"sheets_calls": 0}
+        self.revision = "1"
+        self.gradebook = SyntheticWorksheet(values, self.counter)
+        self.constants = SyntheticWorksheet(constants, self.counter)
+        self.http_client = self
+
+    def get_file_drive_metadata(self, spreadsheet_id):
+        self.counter["sheets_calls"] += 1
+        return {"modifiedTime": self.revision}
+
+    def open_by_key(self, key):
+        return self
+
+    def worksheet(self, name):
+        return self.constants if name == "Constants" else self.gradebook
+
+
+class RedisTraffic:
+    """Counts the commands written to every Redis connection in the process."""
+
+    def __init__(self):
+        import redis.connection
+
+        self.round_trips = 0
+        self.bytes_sent = 0
+        original = redis.connection.AbstractConnection.send_packed_command
+
+        def send_packed_command(connection, command, check_health=True):
+            self.round_trips += 1
+            self.bytes_sent += len(command) if isinstance(command, (bytes, str)) else sum(map(len, command))
+            return original(connection, command, check_health)
+
+        redis.connection.AbstractConnection.send_packed_command = send_packed_command
+
+
+class PeakRss:
+    """Samples the process RSS on a background thread while a phase runs."""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+
+    @staticmethod
+    def current():
+        try:
+            with open("/proc/self/statm") as statm:
+                return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except OSError:  # not Linux: fall back to the process-lifetime peak
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            return peak if sys.platform == "darwin" else peak * 1024
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, self.current())
+
+    def __enter__(self):
+        self.peak = self.current()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self.current())
+
+
+def run_scenario(num_students, num_assignments, num_categories, redis_url=None, chunk_rows=0):
+    """Runs every phase once in this process. Returns {phase: metrics}."""
+    os.environ.update(BENCH_ENV, GRADEBOOK_CHUNK_ROWS=str(chunk_rows))
+    values, constants = synthetic_gradebook(num_students, num_assignments, num_categories)
+
+    import redis
+    import clients
+
+    db, bins_db = int(BENCH_ENV["SERVER_DBINDEX"]), int(BENCH_ENV["BINS_DBINDEX"])
+    if redis_url:
+        pools = {index: redis.ConnectionPool.from_url(redis_url, db=index) for index in (db, bins_db)}
+    else:
+        import fakeredis
+
+        server = fakeredis.FakeServer()
+        pools = {index: fakeredis.FakeRedis(server=server, db=index).connection_pool for index in (db, bins_db)}
+    for index, pool in pools.items():
+        redis.Redis(connection_pool=pool).flushdb()
+    sheets = SyntheticClient(values, constants)
+    clients._redis_pools.update(pools)
+    clients._sheets_client = sheets
+    traffic = RedisTraffic()
+
+    import update_bins
+    import update_db
+
+    changed = [list(row) for row in values]
+    rng = random.Random(1)
+    for _ in range(max(1, num_students * num_assignments // 100)):
+        row, col = rng.randrange(3, len(changed)), rng.randrange(2, len(changed[0]))
+        changed[row][col] = str(rng.randint(0, 5))
+
+    results = {}
+    state = {}
+
+    def phase(name, func):
+        sheets_before = sheets.counter["sheets_calls"]
+        trips_before, bytes_before = traffic.round_trips, traffic.bytes_sent
+        with PeakRss() as rss, contextlib.redirect_stdout(io.StringIO()):
+            started = time.perf_counter()
+            state[name] = func()
+            wall = time.perf_counter() - started
+        results[name] = {
+            "wall_s": round(wall, 4),
+            "redis_round_trips": traffic.round_trips - trips_before,
+            "redis_bytes_sent": traffic.bytes_sent - bytes_before,
+            "sheets_calls": sheets.counter["sheets_calls"] - sheets_before,
+            "peak_rss_mb": round(rss.peak / 2 ** 20, 1),
+        }
+
+    phase("fetch_bins", lambda: update_bins.fetch_bins(force=True))
+    phase("commit_bins", lambda: update_bins.update_bins(force=True, fetched=state["fetch_bins"]))
+    phase("fetch_gradebook", lambda: update_db.fetch_gradebook(force=True))
+    phase("commit_gradebook", lambda: update_db.update_redis(force=True, fetched=state["fetch_gradebook"]))
+    phase("commit_unchanged", lambda: update_db.update_redis(fetched=state["fetch_gradebook"]))
+    sheets.revision = "2"
+    sheets.gradebook.rows = changed
+    changed_values = update_db.fetch_values(sheets.gradebook, head_rows=3) if chunk_rows else changed
+    phase("commit_changed", lambda: update_db.update_redis(fetched=(changed_values, sheets.revision)))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--students", default="100,1000,5000", help="comma-separated roster sizes")
+    parser.add_argument("--assignments", default="50,200", help="comma-separated assignment counts")
+    parser.add_argument("--categories", type=int, default=8)
+    parser.add_argument("--redis", metavar="URL", help="benchmark against this Redis instead of fakeredis")
+    parser.add_argument("--chunk-rows", type=int, default=0, help="stream the gradebook in chunks of this many rows")
+    parser.add_argument("--json", action="store_true", help="print one JSON line per scenario")
+    parser.add_argument("--scenario", help=argparse.SUPPRESS)  # students,assignments: run in this process
+    args = parser.parse_args()
+
+    if args.scenario:
+        num_students, num_assignments = map(int, args.scenario.split(","))
+        print(json.dumps(run_scenario(num_students, num_assignments, args.categories, args.redis, args.chunk_rows)))
+        return
+
+    for num_students in map(int, args.students.split(",")):
+        for num_assignments in map(int, args.assignments.split(",")):
+            command = [sys.executable, os.path.abspath(__file__), "--scenario", f"{num_students},{num_assignments}",
+                       "--categories", str(args.categories), "--chunk-rows", str(args.chunk_rows)] + (["--redis", args.redis] if args.redis else [])
+            child = subprocess.run(command, capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+            if child.returncode != 0:
+                sys.exit(f"Scenario {num_students}x{num_assignments} failed:\n{child.stderr}")
+            results = json.loads(child.stdout.strip().splitlines()[-1])
+
+            if args.json:
+                print(json.dumps({"students": num_students, "assignments": num_assignments,
+                                  "categories": args.categories, "chunk_rows": args.chunk_rows, "phases": results}))
+                continue
+            print(f"\n{num_students} students x {num_assignments} assignments ({args.categories} categories)")
+            print(f"{'phase':<18}{'wall s':>9}{'round trips':>13}{'bytes sent':>13}{'sheets calls':>14}{'peak RSS MB':>13}")
+            for name in PHASES:
+                m = results[name]
+                print(f"{name:<18}{m['wall_s']:>9.3f}{m['redis_round_trips']:>13}{m['redis_bytes_sent']:>13}"
+                      f"{m['sheets_calls']:>14}{m['peak_rss_mb']:>13.1f}")
+
+
+if __name__ == "__main__":
+    main()
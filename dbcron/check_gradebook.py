@@ -0,0 +1,101 @@
+"""
+Offline check of gradebook.py and normalize.py against a recorded worksheet.
+
+Each fixtures/gradebook*.json holds a small values matrix as get_all_values returns
+it (blank, text and non-finite scores, blank rows and gaps), the ASSIGNMENT_* settings
+to parse it with, and what it must produce: the parse_gradebook views, the
+row_chunks rows, and the students' scores and validation issues after
+normalize_scores. The matrix is checked both as one read and streamed through
+RowStream in several chunk sizes, which must yield the same results. No
+network or Redis is needed.
+
+    python check_gradebook.py
+    python check_gradebook.py --record   # after an intended change, rewrites the expected outputs
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+
+import numpy as np
+
+from bench_sync import SyntheticWorksheet
+from gradebook import RowStream, parse_gradebook, row_chunks
+from layout import sheet_layout
+from normalize import normalize_scores
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "gradebook*.json")
+CHUNK_ROWS = [1, 2, 3, 100]  # 1 and 2 give chunks of only blank rows in the fixtures' gaps
+
+
+def parse(values, settings):
+    """Returns the views, the rows and the normalized scores, as one JSON-comparable dict."""
+    gradebook = parse_gradebook(values, **settings)
+    rows = [row for chunk in row_chunks(values, gradebook["fields"]) for row in chunk]
+
+    layout = sheet_layout(gradebook["fields"], gradebook["categories"], gradebook["concepts"])
+    students = [row for row in rows if "@" in str(row[layout.email_index])]
+    cells = np.array([[row[index] for index in layout.column_indexes] for row in students], dtype=object)
+    issues = normalize_scores(cells.reshape(len(students), len(layout.columns)),
+                              [row[layout.email_index] for row in students], layout.columns)
+    return dict(gradebook, rows=rows, scores=cells.tolist(), issues=issues)
+
+
+def _format(value, indent=""):
+    """JSON with one matrix row per line, so a recorded change reads as a short diff."""
+    inner = indent + "  "
+    if isinstance(value, dict) and any(isinstance(item, (list, dict)) for item in value.values()):
+        items = [f"{inner}{json.dumps(key)}: {_format(item, inner)}" for key, item in value.items()]
+        return "{\n" + ",\n".join(items) + f"\n{indent}}}"
+    if isinstance(value, list) and any(isinstance(item, (list, dict)) for item in value):
+        return "[\n" + ",\n".join(inner + _format(item, inner) for item in value) + f"\n{indent}]"
+    return json.dumps(value)
+
+
+def check(fixture):
+    """Returns a list of mismatches between the fixture's expected output and what gradebook.py produces."""
+    settings = fixture["settings"]
+    head_rows = max(settings["category_row"], settings["concepts_row"], settings["max_points_row"])
+    results = {"one read": parse(fixture["values"], settings)}
+    for chunk_rows in CHUNK_ROWS:
+        sheet = SyntheticWorksheet(fixture["values"], {"sheets_calls": 0})
+        results[f"streamed, {chunk_rows} rows per chunk"] = parse(RowStream(sheet, head_rows, chunk_rows), settings)
+
+    mismatches = []
+    for mode, result in results.items():
+        for view, expected in fixture["expected"].items():
+            # Compared as JSON, as NaN cells never equal themselves
+            if json.dumps(result[view]) != json.dumps(expected):
+                mismatches.append(f"{mode}: {view} is {result[view]!r}, expected {expected!r}")
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--record", action="store_true", help="store the current output as the expected one")
+    args = parser.parse_args()
+
+    failed = False
+    for path in sorted(glob.glob(FIXTURES)):
+        with open(path) as fixture_file:
+            fixture = json.load(fixture_file)
+        if args.record:
+            fixture["expected"] = parse(fixture["values"], fixture["settings"])
+            with open(path, "w") as fixture_file:
+                fixture_file.write(_format(fixture) + "\n")
+            print(f"Recorded the expected output in {path}")
+            continue
+
+        mismatches = check(fixture)
+        for mismatch in mismatches:
+            print(f"{os.path.basename(path)}, {mismatch}")
+        if mismatches:
+            failed = True
+        else:
+            print(f"gradebook.py matches {os.path.basename(path)} ({1 + len(CHUNK_ROWS)} read modes)")
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Offline check of the revision-based skipping in revision.py and the jobs.
+
+A stub Drive client hands out canned modifiedTime revisions, and fakeredis
+stands in for Redis, so no network or server is needed. The check covers
+check_revision's decisions (first run, unchanged, --force, new revision, new
+extra input, expired max age, unreadable revision), ensure_revision, and the
+jobs recording a revision only once their sync has succeeded.
+
+    pip install -r requirements-dev.txt
+    python check_revisions.py
+"""
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+
+import fakeredis
+
+from bench_sync import BENCH_ENV, SyntheticClient, synthetic_gradebook
+from revision import REVISION_KEY, RevisionChanged, check_revision, ensure_revision, record_revision
+
+
+class StubDrive:
+    """The Drive metadata half of the gspread client, returning canned revisions."""
+
+    def __init__(self, revision):
+        self.revision = revision
+        self.http_client = self
+
+    def get_file_drive_metadata(self, spreadsheet_id):
+        if isinstance(self.revision, Exception):
+            raise self.revision
+        return {"modifiedTime": self.revision}
+
+
+def check_decisions():
+    """Yields (description, passed) for check_revision, record_revision and ensure_revision."""
+    redis_client = fakeredis.FakeRedis()
+    drive = StubDrive("r1")
+
+    yield "fetches when no revision is recorded", check_revision(drive, redis_client, "id") == (True, "r1")
+    record_revision(redis_client, "r1", extra="bins-1")
+    yield "skips an unchanged revision", check_revision(drive, redis_client, "id", extra="bins-1") == (False, "r1")
+    yield "fetches with force", check_revision(drive, redis_client, "id", force=True, extra="bins-1") == (True, "r1")
+    yield "fetches when skipping is disabled", check_revision(drive, redis_client, "id", max_age=0, extra="bins-1") == (True, "r1")
+    yield "fetches when the extra input changed", check_revision(drive, redis_client, "id", extra="bins-2") == (True, "r1")
+
+    stored = json.loads(redis_client.get(REVISION_KEY))
+    redis_client.set(REVISION_KEY, json.dumps(dict(stored, fetched_at=time.time() - 7200)))
+    yield "fetches once the last fetch is older than max_age", \
+        check_revision(drive, redis_client, "id", max_age=3600, extra="bins-1") == (True, "r1")
+
+    drive.revision = "r2"
+    yield "fetches a new revision", check_revision(drive, redis_client, "id", extra="bins-1") == (True, "r2")
+
+    drive.revision = ConnectionError("Drive unreachable")
+    with contextlib.redirect_stdout(io.StringIO()):
+        decision = check_revision(drive, redis_client, "id", extra="bins-1")
+    yield "fetches when the revision cannot be read", decision == (True, None)
+    record_revision(redis_client, None)
+    yield "records nothing for an unreadable revision", json.loads(redis_client.get(REVISION_KEY))["revision"] == "r1"
+
+    drive.revision = "r2"
+    try:
+        ensure_revision(drive, "id", "r2")
+        ensure_revision(drive, "id", None)
+        yield "ensure_revision accepts an unchanged or unknown revision", True
+    except RevisionChanged:
+        yield "ensure_revision accepts an unchanged or unknown revision", False
+    try:
+        ensure_revision(drive, "id", "r1")
+        yield "ensure_revision rejects a changed revision", False
+    except RevisionChanged:
+        yield "ensure_revision rejects a changed revision", True
+
+
+def check_jobs():
+    """Yields (description, passed) for the skip, --force and record-after-success paths of the jobs."""
+    os.environ.update(BENCH_ENV)
+    values, constants = synthetic_gradebook(5, 4, 2)
+    sheets = SyntheticClient(values, constants)
+
+    import clients
+
+    server = fakeredis.FakeServer()
+    db, bins_db = int(BENCH_ENV["SERVER_DBINDEX"]), int(BENCH_ENV["BINS_DBINDEX"])
+    clients._redis_pools.update({index: fakeredis.FakeRedis(server=server, db=index).connection_pool for index in (db, bins_db)})
+    clients._sheets_client = sheets
+
+    import update_bins
+    import update_db
+
+    def run(job, **kwargs):
+        """Runs job quietly; returns the Sheets calls it made and whether it raised."""
+        before = sheets.counter["sheets_calls"]
+        failed = False
+        with contextlib.redirect_stdout(io.StringIO()):
+            try:
+                job(**kwargs)
+            except Exception:
+                failed = True
+        return sheets.counter["sheets_calls"] - before, failed
+
+    bins_redis = fakeredis.FakeRedis(server=server, db=bins_db)
+    yield "update_bins fetches on its first run", run(update_bins.update_bins) == (2, False)
+    yield "update_bins records the revision it synced", json.loads(bins_redis.get(REVISION_KEY))["revision"] == "1"
+    yield "update_bins skips an unchanged spreadsheet", run(update_bins.update_bins) == (1, False)
+    yield "update_bins fetches with force", run(update_bins.update_bins, force=True) == (2, False)
+    sheets.revision = "2"
+    yield "update_bins fetches a new revision", run(update_bins.update_bins) == (2, False)
+
+    gradebook_redis = fakeredis.FakeRedis(server=server, db=db)
+    sheets.gradebook.rows = values[:3]  # no student rows: the sync fails after the download
+    yield "a failed update_redis raises", run(update_db.update_redis)[1]
+    yield "a failed update_redis records no revision", gradebook_redis.get(REVISION_KEY) is None
+    sheets.gradebook.rows = values
+    yield "update_redis fetches again after a failure", run(update_db.update_redis) == (2, False)
+    yield "update_redis records the revision once it succeeds", json.loads(gradebook_redis.get(REVISION_KEY))["revision"] == "2"
+    yield "update_redis skips an unchanged spreadsheet", run(update_db.update_redis) == (1, False)
+
+
+def main():
+    failed = False
+    for description, passed in [*check_decisions(), *check_jobs()]:
+        print(f"{'ok  ' if passed else 'FAIL'} {description}")
+        failed = failed or not passed
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
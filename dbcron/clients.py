@@ -0,0 +1,49 @@
+"""
+Process-wide Google Sheets and Redis clients.
+
+Every dbcron job used to parse SERVICE_ACCOUNT_CREDENTIALS, authorize gspread
+and open its own Redis connection when its module was imported. Jobs now get
+their clients from here instead, so a long-running process (see sync_daemon.py)
+authorizes once, keeps refreshing the same OAuth token, and reuses one Redis
+connection pool per DB index. Sheets requests are rate limited and retried
+(see ratelimit.py).
+"""
+import gspread
+from google.oauth2.service_account import Credentials
+from dotenv import load_dotenv
+import json
+import os
+import redis
+
+from ratelimit import RateLimitedHTTPClient
+
+load_dotenv()
+
+PORT = int(os.getenv("SERVER_PORT"))
+SCOPES = json.loads(os.getenv("SPREADSHEET_SCOPES"))
+HOST = os.getenv("SERVER_HOST")
+REDIS_PW = os.getenv("REDIS_DB_SECRET")
+
+_sheets_client = None
+_redis_pools = {}
+
+
+def get_sheets_client():
+    """Returns the authorized gspread client, creating it on first use."""
+    global _sheets_client
+    if _sheets_client is None:
+        #needs both spreadsheet and drive access or else there is a permissions error, added as a viewer on the spreadsheet
+        credentials_dict = json.loads(os.getenv("SERVICE_ACCOUNT_CREDENTIALS"))
+        credentials = Credentials.from_service_account_info(credentials_dict, scopes=SCOPES)
+        _sheets_client = gspread.authorize(credentials, http_client=RateLimitedHTTPClient)
+    return _sheets_client
+
+
+def get_redis_client(db):
+    """Returns a Redis client for a DB index, backed by a shared connection pool."""
+    if db not in _redis_pools:
+        if HOST == "redis":  # If running in Docker
+            _redis_pools[db] = redis.ConnectionPool(host=HOST, port=PORT, db=db, password=REDIS_PW)
+        else:  # If running locally
+            _redis_pools[db] = redis.ConnectionPool(host="localhost", port=6379, db=db, password=REDIS_PW)
+    return redis.Redis(connection_pool=_redis_pools[db])
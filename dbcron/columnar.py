@@ -0,0 +1,68 @@
+"""
+Columnar snapshot of the whole class's scores.
+
+Student records are one nested JSON document per student, so any class-wide
+computation has to fetch and parse every one of them. Each sync also publishes
+the score matrix in a form that loads in a single read:
+
+    Score Matrix        float32 students x assignments matrix in .npy format,
+                        NaN where a student has no numeric score
+    Score Matrix Index  JSON {"emails": [...], "columns": [[category, concept], ...]}
+                        labelling the matrix's rows and columns
+
+If SCORE_MATRIX_DIR is set, the same two artifacts are also written to
+SCORE_MATRIX_DIR/<course>/ as score_matrix.npy (memory-mappable with
+np.load(..., mmap_mode="r")) and score_matrix.json, each replaced atomically.
+"""
+import io
+import json
+import os
+
+import numpy as np
+
+from atomicfile import replace_file
+
+SCORE_MATRIX_KEY = "Score Matrix"
+SCORE_MATRIX_INDEX_KEY = "Score Matrix Index"
+SCORE_MATRIX_DIR = os.getenv("SCORE_MATRIX_DIR")
+
+
+def encode_score_matrix(scores):
+    """Serializes the matrix as float32 .npy bytes (deterministic, so diffing works)."""
+    buffer = io.BytesIO()
+    np.save(buffer, np.ascontiguousarray(scores, dtype=np.float32), allow_pickle=False)
+    return buffer.getvalue()
+
+
+def encode_score_index(emails, columns):
+    return json.dumps({"emails": list(emails), "columns": [list(column) for column in columns]})
+
+
+def score_matrix_entries(emails, columns, scores):
+    """Builds the entries update_redis stages in its SnapshotWriter."""
+    return [
+        (SCORE_MATRIX_KEY, encode_score_matrix(scores)),
+        (SCORE_MATRIX_INDEX_KEY, encode_score_index(emails, columns)),
+    ]
+
+
+def load_score_matrix(redis_client):
+    """
+    Reads the published matrix in one round trip. Returns (scores, emails,
+    columns), or None if no snapshot has been published yet.
+    """
+    blob, index = redis_client.mget(SCORE_MATRIX_KEY, SCORE_MATRIX_INDEX_KEY)
+    if blob is None or index is None:
+        return None
+    index = json.loads(index)
+    scores = np.load(io.BytesIO(blob), allow_pickle=False)
+    return scores, index["emails"], [tuple(column) for column in index["columns"]]
+
+
+def write_score_matrix_files(emails, columns, scores, course_name, root=SCORE_MATRIX_DIR):
+    """Writes the matrix and its index under root, if one is configured."""
+    if not root:
+        return
+    directory = os.path.join(root, course_name)
+    replace_file(os.path.join(directory, "score_matrix.npy"), encode_score_matrix(scores))
+    replace_file(os.path.join(directory, "score_matrix.json"), encode_score_index(emails, columns))
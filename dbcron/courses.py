@@ -0,0 +1,125 @@
+"""
+Registry of the courses one dbcron process syncs.
+
+By default there is a single course, configured by the environment variables
+dbcron has always used (SPREADSHEET_ID, SERVER_DBINDEX, ASSIGNMENT_*, ...).
+To sync several courses from one process, point COURSES_FILE at a JSON list
+of courses. Each course needs a name, its spreadsheet_id and sheet_name, and
+its own pair of Redis DBs: db for the gradebook, bins_db for the bins. Those
+DBs are the course's namespace. Layout fields it leaves out default to the
+environment's values:
+
+    [
+        {"name": "cs10", "spreadsheet_id": "1abc...", "sheet_name": "HAID", "db": 0, "bins_db": 1},
+        {"name": "cs61a", "spreadsheet_id": "1def...", "sheet_name": "Grades", "db": 2, "bins_db": 3,
+         "category_row": 3}
+    ]
+
+Redis ships with 16 DBs; for more than 8 courses raise "databases" in the
+Redis server configuration.
+"""
+from dotenv import load_dotenv
+import json
+import os
+
+from clients import get_redis_client
+
+load_dotenv()
+
+COURSES_FILE = os.getenv("COURSES_FILE")
+
+_default_course = None
+
+
+def _env_int(name, default=None):
+    value = os.getenv(name, default)
+    return int(value) if value is not None else None
+
+
+LAYOUT_DEFAULTS = {
+    "category_row": _env_int("ASSIGNMENT_CATEGORYROW"),
+    "category_col": _env_int("ASSIGNMENT_CATEGORYCOL"),
+    "concepts_row": _env_int("ASSIGNMENT_CONCEPTSROW"),
+    "concepts_col": _env_int("ASSIGNMENT_CONCEPTSCOL"),
+    "max_points_row": _env_int("ASSIGNMENT_MAXPOINTSROW"),
+    "max_points_col": _env_int("ASSIGNMENT_MAXPOINTSCOL"),
+    "bins_start_row": _env_int("BINS_START_ROW", "51"),
+    "bins_end_row": _env_int("BINS_END_ROW", "61"),
+    "bins_points_col": _env_int("BINS_POINTS_COL", "0"),  # Column A
+    "bins_grades_col": _env_int("BINS_GRADES_COL", "1"),  # Column B
+    # Rows 16-50 of the Constants sheet: Column A = Assignment name, Column B = Points,
+    # the high-level grading breakdown (Quest, Midterm, Projects, Labs, etc.)
+    "assignment_points_start_row": _env_int("ASSIGNMENT_POINTS_START_ROW", "16"),
+    "assignment_points_end_row": _env_int("ASSIGNMENT_POINTS_END_ROW", "50"),
+}
+
+
+class Course:
+    def __init__(self, name, spreadsheet_id, sheet_name, db, bins_db, **layout):
+        unknown = set(layout) - set(LAYOUT_DEFAULTS)
+        if unknown:
+            raise ValueError(f"Course {name}: unknown settings {sorted(unknown)}")
+        self.name = name
+        self.spreadsheet_id = spreadsheet_id
+        self.sheet_name = sheet_name
+        self.db = int(db)
+        self.bins_db = int(bins_db)
+        for setting, default in LAYOUT_DEFAULTS.items():
+            value = layout.get(setting, default)
+            if value is None:
+                raise ValueError(f"Course {name}: {setting} is not set")
+            setattr(self, setting, int(value))
+
+    @property
+    def redis_client(self):
+        return get_redis_client(self.db)
+
+    @property
+    def bins_client(self):
+        return get_redis_client(self.bins_db)
+
+    def __repr__(self):
+        return f"Course({self.name!r}, db={self.db}, bins_db={self.bins_db})"
+
+
+def env_course():
+    """The single course configured by the environment variables."""
+    return Course(
+        name=os.getenv("COURSE_NAME", "default"),
+        spreadsheet_id=os.getenv("SPREADSHEET_ID"),
+        sheet_name=os.getenv("SPREADSHEET_SHEETNAME"),  # This is the sheet/tab name
+        db=os.getenv("SERVER_DBINDEX"),
+        bins_db=os.getenv("BINS_DBINDEX"),
+    )
+
+
+def load_courses(path=COURSES_FILE):
+    """Reads the registry, or returns [env_course()] when there is none."""
+    if not path:
+        return [env_course()]
+    with open(path) as courses_file:
+        courses = [Course(**settings) for settings in json.load(courses_file)]
+
+    names = [course.name for course in courses]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Course names in {path} are not unique: {names}")
+    dbs = [db for course in courses for db in (course.db, course.bins_db)]
+    if len(set(dbs)) != len(dbs):
+        raise ValueError(f"Courses in {path} share Redis DBs; each needs its own db and bins_db")
+    return courses
+
+
+def default_course():
+    """The course a job syncs when none is given: the first one in the registry."""
+    global _default_course
+    if _default_course is None:
+        _default_course = load_courses()[0]
+    return _default_course
+
+
+def find_course(name):
+    """Looks a course up by name, for the scripts' --course option."""
+    for course in load_courses():
+        if course.name == name:
+            return course
+    raise ValueError(f"No course named {name!r}")
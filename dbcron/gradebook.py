@@ -0,0 +1,149 @@
+"""
+Parsing of the gradebook worksheet from a single values matrix.
+
+The sync used to issue one Sheets API call per metadata row plus one for the
+records. Instead, the whole used range is fetched once (fetch_values) and every
+view the sync needs is derived locally (parse_gradebook). parse_gradebook has no
+network or Redis dependencies, so it can be exercised against a recorded matrix.
+
+For very large rosters, GRADEBOOK_CHUNK_ROWS (0, the default, disables it) makes
+fetch_values return a RowStream instead: only the header and metadata rows are
+read up front, and the rows below them are read GRADEBOOK_CHUNK_ROWS at a time
+while update_redis consumes row_chunks, so at most one chunk of rows is in
+memory at once. The chunk reads are added to the run's Sheets request budget
+(see ratelimit.py), and since they are not one consistent read, update_redis
+checks the spreadsheet's revision again before publishing them.
+"""
+from collections import Counter
+import math
+import os
+
+from gspread.utils import numericise_all, rowcol_to_a1
+
+from ratelimit import current_request_budget, request_budget
+
+GRADEBOOK_CHUNK_ROWS = int(os.getenv("GRADEBOOK_CHUNK_ROWS", "0"))
+
+
+class RowStream:
+    """
+    A worksheet read lazily. head holds rows 1 to head_rows, read when the
+    stream is created; iterating reads the following rows in chunks of
+    chunk_rows, one API call each, made only once the previous chunk has been
+    consumed. Reading goes on to the sheet's row_count, past any blank stretch,
+    since students can follow one. The API trims blank rows from the end of
+    each range; they are put back in front of the next rows read, and dropped
+    at the end of the sheet, so the rows match what get_all_values returns.
+
+    The chunk reads are charged to the request budget of the thread that
+    created the stream, whichever thread iterates it, and that budget is
+    extended by the number of chunks up front, so a long roster does not use
+    it up. reads counts the API calls made so far, the head's included.
+    """
+
+    def __init__(self, sheet, head_rows, chunk_rows):
+        self.sheet = sheet
+        self.head_rows = head_rows
+        self.chunk_rows = chunk_rows
+        self.budget = current_request_budget()
+        self.head = sheet.get_values(f"1:{head_rows}")
+        self.reads = 1
+        self.width = max((len(row) for row in self.head), default=0)
+
+    def __iter__(self):
+        if not self.width:
+            return
+        last_row = self.sheet.row_count
+        if self.budget is not None:
+            self.budget.extend(math.ceil(max(last_row - self.head_rows, 0) / self.chunk_rows))
+        blank_rows = 0  # blank rows read since the last yielded row; get_all_values keeps them
+        for start in range(self.head_rows + 1, last_row + 1, self.chunk_rows):
+            end = min(start + self.chunk_rows - 1, last_row)
+            with request_budget(self.budget):
+                rows = self.sheet.get_values(f"{rowcol_to_a1(start, 1)}:{rowcol_to_a1(end, self.width)}")
+            self.reads += 1
+            if not any(rows):
+                blank_rows += end - start + 1
+                continue
+            yield [[] for _ in range(blank_rows)] + rows
+            blank_rows = end - start + 1 - len(rows)
+
+
+def fetch_values(sheet, head_rows=1, chunk_rows=GRADEBOOK_CHUNK_ROWS):
+    """
+    Reads the worksheet's whole used range in one API call, or returns a
+    RowStream reading it in chunks when chunk_rows is set. head_rows is the
+    last row parse_gradebook needs before the records (metadata rows).
+    """
+    if chunk_rows > 0:
+        return RowStream(sheet, head_rows, chunk_rows)
+    return sheet.get_all_values()
+
+
+def _row(values, row_number):
+    """
+    Returns a 1-indexed row with trailing empty cells dropped, matching what
+    Worksheet.row_values returns.
+    """
+    if row_number < 1 or row_number > len(values):
+        return []
+    row = list(values[row_number - 1])
+    while row and row[-1] == "":
+        row.pop()
+    return row
+
+
+def _header(values, header_row):
+    """The header row padded to the width of the widest row, as get_all_records keys it."""
+    width = max(len(row) for row in values)
+    header = list(values[header_row - 1]) + [""] * (width - len(values[header_row - 1]))
+
+    duplicates = [name for name, count in Counter(header).items() if count > 1]
+    if duplicates:
+        raise ValueError(f"The header row in the worksheet contains duplicates: {duplicates}")
+    return header
+
+
+def _padded(rows, width):
+    """Pads each row to width and numericises it, as get_all_records does."""
+    return [numericise_all(list(row) + [""] * (width - len(row))) for row in rows]
+
+
+def parse_gradebook(values, category_row, category_col, concepts_row, concepts_col,
+                    max_points_row, max_points_col, header_row=1):
+    """
+    Derives the gradebook views from a values matrix (a list of rows of cell
+    strings, as returned by Worksheet.get_all_values) or from the head of a
+    RowStream. Rows are 1-indexed and columns 0-indexed, like the ASSIGNMENT_*
+    settings.
+
+    Returns a dict with:
+        header: the header row, without its trailing empty cells
+        categories, concepts, max_points: the assignment metadata rows, sliced
+            from their configured starting columns
+        fields: the header padded to the sheet's width, one name per column
+            of the rows row_chunks yields (see layout.py)
+    """
+    if isinstance(values, RowStream):
+        values = values.head
+    return {
+        "header": _row(values, header_row),
+        "categories": _row(values, category_row)[category_col:],
+        "concepts": _row(values, concepts_row)[concepts_col:],
+        "max_points": _row(values, max_points_row)[max_points_col:],
+        "fields": _header(values, header_row) if len(values) >= header_row else [],
+    }
+
+
+def row_chunks(values, fields, header_row=1):
+    """
+    Yields the rows below the header in lists, each row padded to the width of
+    fields (from parse_gradebook) and numericised: all of them at once for a
+    values matrix, or the rest of the head and then each chunk read for a
+    RowStream.
+    """
+    head = values.head if isinstance(values, RowStream) else values
+    yield _padded(head[header_row:], len(fields))
+    if isinstance(values, RowStream) and fields:
+        for rows in values:
+            yield _padded(rows, len(fields))
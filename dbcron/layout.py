@@ -0,0 +1,79 @@
+"""
+Where each value of a student row lives in the gradebook worksheet.
+
+update_redis used to rediscover the layout for every sync, and for every row
+looked the name, email and scores up by header name in a per-row dict.
+SheetLayout resolves it once per distinct header instead: the name and email
+column indexes, the index of every (category, concept) column, the
+StudentSchema built from those columns and the grouping of columns per
+category used to build the keyed record. sheet_layout caches layouts by the
+header, category and concept rows, so the resident scheduler resolves a
+sheet's layout only when someone edits those rows. The layout's version is a
+digest of them.
+"""
+import functools
+import hashlib
+import json
+
+from records import StudentSchema
+from stats import score_columns
+
+LAYOUT_CACHE_SIZE = 16  # distinct headers kept, e.g. one per course
+
+
+def name_field(fields):
+    """
+    Picks the header of the student name column: "Legal Name" if there is
+    one, else the first column's, which is often empty.
+    """
+    if "Legal Name" in fields:
+        return "Legal Name"
+    return fields[0] if fields else None
+
+
+class SheetLayout:
+    def __init__(self, fields, categories, concepts):
+        self.fields = list(fields)
+        self.version = hashlib.sha1(
+            json.dumps([self.fields, list(categories), list(concepts)]).encode("utf-8")
+        ).hexdigest()[:12]
+        indexes = {field: index for index, field in enumerate(self.fields)}
+
+        if "Email" not in indexes:
+            raise ValueError("The header row has no 'Email' column")
+        self.email_index = indexes["Email"]
+        name = name_field(self.fields)
+        if name is None:
+            raise ValueError("Could not determine name column. Please ensure the spreadsheet has a name column in the first column.")
+        # A sheet whose first column is Email has its names, if any, in the next column
+        self.name_index = indexes[name] if name != "Email" else (self.email_index + 1 if len(self.fields) > 1 else None)
+
+        self.columns = score_columns(categories, concepts)
+        missing = [concept for _, concept in self.columns if concept not in indexes]
+        if missing:
+            raise ValueError(f"Concepts missing from the header row: {missing}")
+        self.column_indexes = [indexes[concept] for _, concept in self.columns]
+        self.schema = StudentSchema(self.columns)
+
+        # category -> [(concept, position in columns)], in sheet order
+        self.groups = {}
+        for position, (category, concept) in enumerate(self.columns):
+            self.groups.setdefault(category, []).append((concept, position))
+
+    def assignments(self, scores):
+        """The keyed {category: {concept: score}} dict of one row of scores in column order."""
+        return {category: {concept: scores[position] for concept, position in concepts}
+                for category, concepts in self.groups.items()}
+
+    def __repr__(self):
+        return f"SheetLayout({self.version}, {len(self.columns)} columns)"
+
+
+@functools.lru_cache(maxsize=LAYOUT_CACHE_SIZE)
+def _cached_layout(fields, categories, concepts):
+    return SheetLayout(fields, categories, concepts)
+
+
+def sheet_layout(fields, categories, concepts):
+    """The layout for the padded header fields and the category and concept rows, cached."""
+    return _cached_layout(tuple(fields), tuple(categories), tuple(concepts))
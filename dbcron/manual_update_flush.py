@@ -1,11 +1,9 @@
-from update_db import update_redis
-from flush_db import flush_redis_db
-from update_bins import update_bins
-import redis
-import os
+from sync_runner import run_sync
 from dotenv import load_dotenv
 load_dotenv()
 if __name__ == "__main__":
-    flush_redis_db()
-    update_redis()
-    update_bins()
+    # No flush needed: update_redis swaps the new snapshot in atomically and
+    # removes students that are no longer on the roster.
+    # Cold start: always fetch, whatever revision was recorded before. The
+    # gradebook and bins downloads run concurrently.
+    run_sync(force=True)
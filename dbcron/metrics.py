@@ -0,0 +1,132 @@
+"""
+Per-phase metrics for the dbcron jobs.
+
+Each job run records the duration, rows handled, API calls (Sheets requests or
+Redis round trips) and bytes written of every phase. When the run finishes the
+metrics are:
+
+    - printed as one JSON log line ({"event": "dbcron_job", ...})
+    - stored as Prometheus text-format metrics under dbcron:metrics:<job>, in
+      the Redis DB the job writes for its course
+    - written to METRICS_DIR/dbcron_<job>_<course>.prom, if METRICS_DIR is set
+      (for node_exporter's textfile collector)
+
+Every run also reports dbcron_last_success_timestamp_seconds, kept in
+dbcron:last_success:<job>, so a scrape can alert when a job stops succeeding.
+Every metric is labelled with the job (dbcron_job) and the course.
+A run that skipped an unchanged spreadsheet counts as a success.
+"""
+import json
+import os
+import time
+
+from atomicfile import replace_file
+
+METRICS_KEY_PREFIX = "dbcron:metrics"
+LAST_SUCCESS_KEY_PREFIX = "dbcron:last_success"
+METRICS_DIR = os.getenv("METRICS_DIR")
+
+PHASE_METRICS = [
+    ("duration_s", "dbcron_phase_duration_seconds", "Duration of each phase of the job's last run."),
+    ("rows", "dbcron_phase_rows", "Rows (or keys) handled by each phase of the job's last run."),
+    ("api_calls", "dbcron_phase_api_calls", "Sheets requests or Redis round trips made by each phase of the job's last run."),
+    ("bytes_written", "dbcron_phase_bytes_written", "Bytes written by each phase of the job's last run."),
+]
+
+_runs = {}
+
+
+class JobMetrics:
+    def __init__(self, job, course="default"):
+        self.job = job
+        self.course = course
+        self.started_at = time.time()
+        self.phases = {}
+        self._checkpoint = time.perf_counter()
+
+    def mark(self):
+        """Starts timing the next phase from now."""
+        self._checkpoint = time.perf_counter()
+
+    def lap(self, phase, rows=0, api_calls=0, bytes_written=0):
+        """Records a phase that ran since the last mark or lap; repeated phases add up."""
+        now = time.perf_counter()
+        counters = self.phases.setdefault(phase, {"duration_s": 0.0, "rows": 0, "api_calls": 0, "bytes_written": 0})
+        counters["duration_s"] += now - self._checkpoint
+        counters["rows"] += rows
+        counters["api_calls"] += api_calls
+        counters["bytes_written"] += bytes_written
+        self._checkpoint = now
+
+    def finish(self, redis_client, success, skipped=False):
+        """Emits the run's metrics. Failing to store them never fails the job."""
+        if _runs.get((self.job, self.course)) is self:
+            del _runs[(self.job, self.course)]
+        finished_at = time.time()
+        last_success_key = f"{LAST_SUCCESS_KEY_PREFIX}:{self.job}"
+        record = {
+            "event": "dbcron_job",
+            "job": self.job,
+            "course": self.course,
+            "success": success,
+            "skipped": skipped,
+            "started_at": self.started_at,
+            "duration_s": round(finished_at - self.started_at, 4),
+            "last_success": finished_at if success else None,
+            "phases": {name: dict(counters, duration_s=round(counters["duration_s"], 4))
+                       for name, counters in self.phases.items()},
+        }
+        try:
+            if success:
+                redis_client.set(last_success_key, finished_at)
+            else:
+                stored = redis_client.get(last_success_key)
+                record["last_success"] = float(stored) if stored is not None else None
+            text = prometheus_text(record)
+            redis_client.set(f"{METRICS_KEY_PREFIX}:{self.job}", text)
+            if METRICS_DIR:
+                replace_file(os.path.join(METRICS_DIR, f"dbcron_{self.job}_{self.course}.prom"), text)
+        except Exception as e:
+            print(f"Could not store metrics for {self.job} ({self.course}): {e}")
+        print(json.dumps(record), flush=True)
+        return record
+
+
+def job_metrics(job, course="default", new=False):
+    """
+    Returns the metrics of the job's current run for a course, starting one if
+    there is none or new is set. A run can span several calls (fetch_gradebook,
+    then update_redis) and ends with JobMetrics.finish.
+    """
+    if new or (job, course) not in _runs:
+        _runs[(job, course)] = JobMetrics(job, course)
+    return _runs[(job, course)]
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def prometheus_text(record):
+    """Renders a finished run (see JobMetrics.finish) in the Prometheus text format."""
+    # Not "job": Prometheus sets that label to the scrape job, and the
+    # textfile collector's metrics would otherwise clash with it
+    job = f'dbcron_job="{_label(record["job"])}",course="{_label(record["course"])}"'
+    lines = []
+    for field, name, help_text in PHASE_METRICS:
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+        for phase, counters in record["phases"].items():
+            lines.append(f'{name}{{{job},phase="{_label(phase)}"}} {counters[field]}')
+
+    gauges = [
+        ("dbcron_run_duration_seconds", "Duration of the job's last run.", record["duration_s"]),
+        ("dbcron_run_success", "Whether the job's last run succeeded.", int(record["success"])),
+        ("dbcron_run_skipped", "Whether the job's last run skipped an unchanged spreadsheet.", int(record["skipped"])),
+        ("dbcron_last_run_timestamp_seconds", "Unix time the job's last run started.", record["started_at"]),
+    ]
+    if record["last_success"] is not None:
+        gauges.append(("dbcron_last_success_timestamp_seconds", "Unix time the job last succeeded.", record["last_success"]))
+    for name, help_text, value in gauges:
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge", f"{name}{{{job}}} {value}"]
+    return "\n".join(lines) + "\n"
+
@@ -0,0 +1,70 @@
+"""
+Score normalization done once per sync.
+
+gspread hands back each cell as a number, an empty string or text ("N/A",
+"Excused", " 7 ", ...), and every API route used to re-check isNaN/Number() on
+every cell of every request. update_redis now stores each score as a number or
+null. Cells that are neither numbers nor blank are recorded in the
+"Validation Report" key, so that staff can find and fix them in the sheet.
+"""
+import json
+import math
+
+import numpy as np
+
+from aggregates import is_score
+
+VALIDATION_REPORT_KEY = "Validation Report"
+MAX_REPORTED_CELLS = 500  # the report keeps a count of the rest
+
+_is_score = np.frompyfunc(is_score, 1, 1)
+
+
+def parse_score(value):
+    """
+    Converts a non-numeric cell to a score. Returns (score, ok): blanks give
+    (None, True), numeric text such as " 7 " gives its number, anything else
+    (None, False).
+    """
+    text = str(value).strip()
+    if not text:
+        return None, True
+    try:
+        number = float(text)
+    except ValueError:
+        return None, False
+    if not math.isfinite(number):
+        return None, False
+    return (int(number) if number.is_integer() else number), True
+
+
+def normalize_scores(cells, emails, columns):
+    """
+    Normalizes a students x columns object array of raw cells in place: finite
+    numeric cells are kept as they are and the rest are parsed with parse_score,
+    so non-finite ones become null and are reported. emails
+    and columns label the rows and columns for the report.
+    Returns the list of unparseable cells as dicts (email, category, concept, value).
+    """
+    issues = []
+    if cells.size == 0:
+        return issues
+    needs_parsing = ~_is_score(cells).astype(bool)
+    for row, col in zip(*np.nonzero(needs_parsing)):
+        value = cells[row, col]
+        cells[row, col], ok = parse_score(value)
+        if not ok:
+            category, concept = columns[col]
+            issues.append({"email": emails[row], "category": category, "concept": concept, "value": str(value)})
+    return issues
+
+
+def validation_report(issues, count=None):
+    """
+    The JSON stored under VALIDATION_REPORT_KEY. count is the total number of
+    unparseable cells when issues holds only the first of them.
+    """
+    return json.dumps({
+        "unparseable_count": len(issues) if count is None else count,
+        "unparseable": issues[:MAX_REPORTED_CELLS],
+    })
@@ -0,0 +1,197 @@
+"""
+Rate limiting and retries for every Google Sheets/Drive request dbcron makes.
+
+clients.py authorizes gspread with RateLimitedHTTPClient, so every request,
+including Drive metadata reads, goes through:
+
+    - a process-wide token bucket (SHEETS_REQUESTS_PER_MINUTE, bursts of up to
+      SHEETS_BURST) shared by the concurrent fetch threads
+    - retries of 429, 408, 5xx, Drive usageLimits 403s and connection errors,
+      with exponential backoff and full jitter (SHEETS_RETRY_BASE doubling up
+      to SHEETS_RETRY_MAX seconds, honouring Retry-After), at most
+      SHEETS_MAX_RETRIES times per request
+    - a per-run request budget (SHEETS_RUN_BUDGET, 0 disables): each job calls
+      reset_request_budget when it starts, and a run that keeps failing stops
+      with RequestBudgetExceeded instead of hammering the quota. Reads whose
+      count depends on the sheet's size, such as a RowStream's chunks (see
+      gradebook.py), are added to the budget with extend_request_budget, so it
+      only has to cover the fixed requests and the retries. Work a run hands to
+      another thread keeps charging the run's budget with request_budget
+
+A throttled run therefore finishes late but with the real data. When it
+fails outright, the error is raised so the job keeps the data it already
+has in Redis and the scheduler retries later.
+"""
+from dotenv import load_dotenv
+from http import HTTPStatus
+import contextlib
+import os
+import random
+import threading
+import time
+
+from gspread.exceptions import APIError
+from gspread.http_client import HTTPClient
+import requests
+
+load_dotenv()
+
+SHEETS_REQUESTS_PER_MINUTE = float(os.getenv("SHEETS_REQUESTS_PER_MINUTE", "60"))
+SHEETS_BURST = int(os.getenv("SHEETS_BURST", "10"))
+SHEETS_RETRY_BASE = float(os.getenv("SHEETS_RETRY_BASE", "1"))
+SHEETS_RETRY_MAX = float(os.getenv("SHEETS_RETRY_MAX", "64"))
+SHEETS_MAX_RETRIES = int(os.getenv("SHEETS_MAX_RETRIES", "6"))
+SHEETS_RUN_BUDGET = int(os.getenv("SHEETS_RUN_BUDGET", "50"))
+
+RETRY_STATUSES = {HTTPStatus.REQUEST_TIMEOUT, HTTPStatus.TOO_MANY_REQUESTS}
+
+
+class RequestBudgetExceeded(Exception):
+    """Raised when a job run has used up its Sheets request budget."""
+
+
+class TokenBucket:
+    def __init__(self, rate_per_minute, burst):
+        self.rate = rate_per_minute / 60
+        self.capacity = max(burst, 1)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Blocks until a request may be sent."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+_bucket = TokenBucket(SHEETS_REQUESTS_PER_MINUTE, SHEETS_BURST)
+_budget = threading.local()
+
+# Errors that mean the spreadsheet could not be read (as opposed to read but malformed)
+SHEETS_ERRORS = (APIError, requests.RequestException, RequestBudgetExceeded)
+
+
+class RequestBudget:
+    """The Sheets requests a job run may still make; None remaining means unlimited."""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.remaining = limit if limit > 0 else None
+
+    def extend(self, count):
+        if self.remaining is None:
+            return
+        self.limit += count
+        self.remaining += count
+
+    def spend(self):
+        if self.remaining is None:
+            return
+        if self.remaining <= 0:
+            raise RequestBudgetExceeded(f"Sheets request budget of {self.limit} per run used up")
+        self.remaining -= 1
+
+
+def reset_request_budget(limit=SHEETS_RUN_BUDGET):
+    """Starts a new run's request budget for the calling thread and returns it."""
+    _budget.current = RequestBudget(limit)
+    return _budget.current
+
+
+def current_request_budget():
+    """The calling thread's run budget, or None if it has not started one."""
+    return getattr(_budget, "current", None)
+
+
+@contextlib.contextmanager
+def request_budget(budget):
+    """
+    Charges the calling thread's requests to budget inside the block, so a run
+    whose work moves to another thread (like a RowStream read while committing
+    on the main thread) keeps spending the budget it started with.
+    """
+    previous = current_request_budget()
+    _budget.current = budget
+    try:
+        yield budget
+    finally:
+        _budget.current = previous
+
+
+def extend_request_budget(count):
+    """Adds count requests to the calling thread's budget, if it has one."""
+    budget = current_request_budget()
+    if budget is not None:
+        budget.extend(count)
+
+
+def _spend_budget():
+    budget = current_request_budget()
+    if budget is not None:
+        budget.spend()
+
+
+def http_status(error):
+    """
+    The HTTP status of a failed request. APIError.code comes from the JSON error
+    body and is -1 when there is none, e.g. for the HTML 502/503/504 pages of
+    Google's front end, so the response's own status code is used instead.
+    """
+    response = getattr(error, "response", None)
+    if response is not None:
+        return response.status_code
+    return getattr(error, "code", None)
+
+
+def is_retryable(error):
+    """True for rate limiting, timeouts and server errors; False for e.g. a bad range."""
+    if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+        return True
+    if not isinstance(error, APIError):
+        return False
+    status = http_status(error)
+    if status in RETRY_STATUSES or status >= HTTPStatus.INTERNAL_SERVER_ERROR:
+        return True
+    # The Drive API reports rate limiting as a 403
+    details = error.error.get("errors") or [{}]
+    return status == HTTPStatus.FORBIDDEN and details[0].get("domain") == "usageLimits"
+
+
+def backoff_delay(attempt, retry_after=None):
+    """Full-jitter exponential backoff, never shorter than the server's Retry-After."""
+    delay = random.uniform(0, min(SHEETS_RETRY_MAX, SHEETS_RETRY_BASE * 2 ** attempt))
+    if retry_after:
+        try:
+            delay = max(delay, float(retry_after))
+        except ValueError:
+            pass
+    return delay
+
+
+class RateLimitedHTTPClient(HTTPClient):
+    def request(self, *args, **kwargs):
+        attempt = 0
+        while True:
+            _spend_budget()
+            _bucket.acquire()
+            try:
+                return super().request(*args, **kwargs)
+            except (APIError, requests.ConnectionError, requests.Timeout) as e:
+                if attempt >= SHEETS_MAX_RETRIES or not is_retryable(e):
+                    raise
+                response = getattr(e, "response", None)
+                retry_after = response.headers.get("Retry-After") if response is not None else None
+                delay = backoff_delay(attempt, retry_after)
+                status = http_status(e) or type(e).__name__
+                print(f"Sheets request failed ({status}), retrying in {delay:.1f}s "
+                      f"(retry {attempt + 1} of {SHEETS_MAX_RETRIES})", flush=True)
+                time.sleep(delay)
+                attempt += 1
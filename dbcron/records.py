@@ -0,0 +1,81 @@
+"""
+Encodings for the per-student records update_redis stores.
+
+    json        (default) the keyed document:
+                {"Legal Name": ..., "Assignments": {category: {concept: score}},
+                 "Aggregates": {"Section Totals": {...}, "Total": ..., "Grade": ...}}
+    positional  a JSON array whose order follows the shared "Student Schema" key:
+                [version, legal name, [score per column], [total per section], total, grade]
+
+Category and concept names repeat in every keyed record; the positional form
+stores them once, in the schema. The schema's version is a digest of its
+columns and is repeated in every record, so a reader can tell when a record
+and the schema it holds do not match.
+
+STUDENT_ENCODING selects the encoding. Switching it is the migration: the next
+sync rewrites every record in the new encoding (and publishes or removes the
+schema) in the same atomic swap as any other change.
+"""
+import hashlib
+import json
+import os
+
+STUDENT_ENCODING = os.getenv("STUDENT_ENCODING", "json")
+STUDENT_ENCODINGS = ("json", "positional")
+SCHEMA_KEY = "Student Schema"
+
+
+class StudentSchema:
+    def __init__(self, columns):
+        self.columns = list(columns)
+        self.sections = list(dict.fromkeys(category for category, _ in self.columns))
+        self.version = hashlib.sha1(json.dumps(self.columns).encode("utf-8")).hexdigest()[:12]
+
+    def to_json(self):
+        return json.dumps({
+            "version": self.version,
+            "columns": [list(column) for column in self.columns],
+            "sections": self.sections,
+        })
+
+
+def encode_student(student, schema=None, encoding=STUDENT_ENCODING):
+    """Serializes one record built by update_redis. schema is required for positional."""
+    if encoding == "json":
+        return json.dumps(student)
+    if encoding != "positional":
+        raise ValueError(f"Unknown STUDENT_ENCODING {encoding!r}, expected one of {STUDENT_ENCODINGS}")
+
+    assignments = student["Assignments"]
+    aggregates = student["Aggregates"]
+    return json.dumps([
+        schema.version,
+        student["Legal Name"],
+        [assignments[category][concept] for category, concept in schema.columns],
+        [aggregates["Section Totals"][section] for section in schema.sections],
+        aggregates["Total"],
+        aggregates["Grade"],
+    ], separators=(",", ":"))
+
+
+def decode_student(value, schema=None):
+    """Parses a stored record in either encoding back into the keyed document."""
+    stored = json.loads(value)
+    if isinstance(stored, dict):
+        return stored
+
+    version, legal_name, scores, section_totals, total, grade = stored
+    if schema is None or schema.version != version:
+        raise ValueError(f"Record uses {SCHEMA_KEY} version {version}, which is not the one given")
+    assignments = {}
+    for (category, concept), score in zip(schema.columns, scores):
+        assignments.setdefault(category, {})[concept] = score
+    return {
+        "Legal Name": legal_name,
+        "Assignments": assignments,
+        "Aggregates": {
+            "Section Totals": dict(zip(schema.sections, section_totals)),
+            "Total": total,
+            "Grade": grade,
+        },
+    }
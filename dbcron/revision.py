@@ -0,0 +1,79 @@
+"""
+Conditional fetching of the spreadsheet based on its Drive modifiedTime.
+
+Reading the Drive metadata of the spreadsheet is a single cheap request, far
+lighter than downloading a worksheet. Each job stores the revision it last
+synced in its own Redis DB and skips the download when the revision is
+unchanged. Because values computed by formulas (e.g. IMPORTRANGE) can change
+without the file being modified, a full fetch is still forced once the last
+one is older than REVISION_MAX_AGE seconds.
+
+A sheet read in several chunks (see gradebook.py) is not one consistent read,
+so update_redis calls ensure_revision before publishing it and drops the run
+if the spreadsheet was modified in the meantime.
+"""
+import json
+import os
+import time
+
+REVISION_KEY = "dbcron:revision"
+REVISION_MAX_AGE = int(os.getenv("REVISION_MAX_AGE", "3600"))  # 0 disables skipping
+
+
+class RevisionChanged(Exception):
+    """Raised when the spreadsheet was modified while a job was reading it."""
+
+
+def spreadsheet_revision(client, spreadsheet_id):
+    """Returns the spreadsheet's Drive modifiedTime without opening it."""
+    return client.http_client.get_file_drive_metadata(spreadsheet_id)["modifiedTime"]
+
+
+def check_revision(client, redis_client, spreadsheet_id, force=False, max_age=REVISION_MAX_AGE, extra=None):
+    """
+    Decides whether a job needs to fetch the spreadsheet. extra identifies any
+    other input the job's output depends on (e.g. a digest of the bins); a
+    change in it forces a fetch just like a new revision does.
+
+    Returns (should_fetch, revision). revision is None if it could not be read,
+    in which case the job always fetches; pass it to record_revision once the
+    sync has succeeded.
+    """
+    try:
+        revision = spreadsheet_revision(client, spreadsheet_id)
+    except Exception as e:
+        print(f"Could not read spreadsheet revision, fetching anyway: {e}")
+        return True, None
+
+    if force or max_age <= 0:
+        return True, revision
+
+    stored = redis_client.get(REVISION_KEY)
+    if stored is None:
+        return True, revision
+    stored = json.loads(stored)
+    if stored.get("revision") != revision or stored.get("extra") != extra:
+        return True, revision
+    if time.time() - stored.get("fetched_at", 0) >= max_age:
+        return True, revision
+    return False, revision
+
+
+def ensure_revision(client, spreadsheet_id, revision):
+    """
+    Raises RevisionChanged if the spreadsheet's revision is no longer the one
+    check_revision returned. A revision of None could not be read, so there is
+    nothing to compare against.
+    """
+    if revision is None:
+        return
+    current = spreadsheet_revision(client, spreadsheet_id)
+    if current != revision:
+        raise RevisionChanged(f"Spreadsheet modified while it was being read ({revision} -> {current})")
+
+
+def record_revision(redis_client, revision, extra=None):
+    """Stores the revision (and extra inputs) a job just synced successfully."""
+    if revision is None:
+        return
+    redis_client.set(REVISION_KEY, json.dumps({"revision": revision, "extra": extra, "fetched_at": time.time()}))
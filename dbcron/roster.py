@@ -0,0 +1,41 @@
+"""
+Secondary indexes of the roster, rebuilt on every sync.
+
+Student records are bare email keys sharing a DB with "Categories", "Stats"
+and friends, so listing students used to mean KEYS *@* plus one GET per key
+for the names. The sync now publishes explicit indexes alongside the records:
+
+    Roster                    sorted set of student emails, scored by their
+                              row order in the gradebook (stable paging)
+    Roster Names              hash of email -> legal name
+    Section Members:<section> sorted set of the students with a numeric score
+                              in the section, scored by their section total
+"""
+from snapshot import SortedSet
+
+ROSTER_KEY = "Roster"
+ROSTER_NAMES_KEY = "Roster Names"
+SECTION_MEMBERS_PREFIX = "Section Members:"
+
+
+def roster_entries(students):
+    """
+    Builds the index entries update_redis stages in its SnapshotWriter from
+    the (email, entry) pairs of the students. Returns an empty list for an
+    empty roster.
+    """
+    if not students:
+        return []
+
+    entries = [
+        (ROSTER_KEY, SortedSet((email, position) for position, (email, _) in enumerate(students))),
+        (ROSTER_NAMES_KEY, {email: student["Legal Name"] for email, student in students}),
+    ]
+
+    members = {}
+    for email, student in students:
+        for section, total in student["Aggregates"]["Section Totals"].items():
+            if total is not None:
+                members.setdefault(section, SortedSet())[email] = total
+    entries.extend((SECTION_MEMBERS_PREFIX + section, scores) for section, scores in members.items())
+    return entries
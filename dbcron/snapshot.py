@@ -0,0 +1,204 @@
+"""
+Double-buffered publishing of a sync into Redis.
+
+A sync is first written under a private staging namespace, then published in
+a single MULTI/EXEC transaction that RENAMEs every staged key onto its live
+name and deletes the keys the previous generation owned but this one does not.
+Readers (the API reads bare email keys and "Categories") therefore see either
+the old dataset or the new one, never a partially written or flushed one.
+
+Values are strings, non-empty dicts which are stored as Redis hashes, or
+non-empty SortedSet mappings which are stored as Redis sorted sets.
+
+Syncs are incremental: a content digest of every live value is kept in Redis,
+and only entries whose digest changed are staged and renamed, so a quiet tick
+touches a few keys instead of the whole roster.
+
+Staging keys and the bookkeeping keys below deliberately contain no "@" so
+they never show up in the API's KEYS *@* roster lookup.
+"""
+import hashlib
+import json
+
+GENERATION_KEY = "dbcron:generation"  # counter used to name staging namespaces
+PUBLISHED_KEY = "dbcron:published"  # generation currently visible to readers
+DIGESTS_KEY = "dbcron:digests"  # hash of live key -> digest of its value, one field per live key
+STAGING_PREFIX = "dbcron:staging"
+STAGING_TTL = 3600  # seconds; staged keys of a crashed run expire on their own
+
+
+class StagingExpired(Exception):
+    """Raised when staged keys vanished (e.g. their TTL ran out) before the publish."""
+
+
+class SortedSet(dict):
+    """A member -> score mapping to be stored as a Redis sorted set."""
+
+
+def digest(value):
+    if isinstance(value, dict):
+        value = json.dumps(value, sort_keys=True)
+    if isinstance(value, str):
+        value = value.encode("utf-8")
+    return hashlib.sha1(value).hexdigest()
+
+
+def value_size(value):
+    """Payload bytes of an entry's value: field names plus values for hashes and sorted sets."""
+    if isinstance(value, dict):
+        return sum(len(str(field).encode("utf-8")) + len(str(item).encode("utf-8")) for field, item in value.items())
+    if isinstance(value, str):
+        return len(value.encode("utf-8"))
+    return len(value)
+
+
+def _queue_write(pipe, key, value, ttl=None):
+    if isinstance(value, SortedSet):
+        if not value:
+            raise ValueError(f"Cannot store an empty sorted set under {key}")
+        pipe.zadd(key, value)
+        if ttl:
+            pipe.expire(key, ttl)
+    elif isinstance(value, dict):
+        if not value:
+            raise ValueError(f"Cannot store an empty hash under {key}")
+        pipe.hset(key, mapping=value)
+        if ttl:
+            pipe.expire(key, ttl)
+    else:
+        pipe.set(key, value, ex=ttl)
+
+
+def _decode(value):
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def _previous_digests(redis_client):
+    digests = redis_client.hgetall(DIGESTS_KEY)
+    if digests:
+        return {_decode(key): _decode(value) for key, value in digests.items()}
+    # First publish on a database filled by the old flush-then-reload sync:
+    # adopt every student key (with an unknown digest) so dropped students
+    # still get collected and everyone else is rewritten once.
+    return {_decode(key): None for key in redis_client.scan_iter(match="*@*", count=1000)}
+
+
+class SnapshotWriter:
+    """
+    Publishes a snapshot whose entries arrive one at a time, e.g. while the
+    gradebook is still being read. Each added or changed entry is staged as it
+    is added, in pipelines of at most chunk_size entries, so only the keys and
+    digests of the snapshot stay in memory, never all of its values.
+
+    Passing full=True stages every entry regardless of its digest, which repairs
+    live keys that were modified or deleted behind the sync's back.
+    """
+
+    def __init__(self, redis_client, chunk_size, full=False):
+        if chunk_size < 1:
+            raise ValueError(f"Chunk size must be at least 1, got {chunk_size}")
+        self.redis_client = redis_client
+        self.chunk_size = chunk_size
+        self.full = full
+        self.previous = _previous_digests(redis_client)
+        self.digests = {}  # key -> digest of every entry added so far
+        self.staged = []  # (staging key, live key) of the entries to publish
+        self.generation = None
+        self.pipe = redis_client.pipeline(transaction=False)
+        self.pending = 0
+        self.summary = {
+            "generation": None,
+            "added": 0,
+            "changed": 0,
+            "removed": 0,
+            "unchanged": 0,
+            "round_trips": 1,
+            "bytes_written": 0,
+        }
+
+    def add(self, key, value):
+        """Adds an entry, staging it unless the published value is identical."""
+        entry_digest = digest(value)
+        # A key added twice (e.g. an email listed twice) is staged again, so the last one wins
+        duplicate = key in self.digests
+        self.digests[key] = entry_digest
+        if not duplicate:
+            if key not in self.previous:
+                self.summary["added"] += 1
+            elif self.full or self.previous[key] != entry_digest:
+                self.summary["changed"] += 1
+            else:
+                self.summary["unchanged"] += 1
+                return
+
+        if self.generation is None:
+            self.generation = self.redis_client.incr(GENERATION_KEY)
+            self.summary["round_trips"] += 1
+        staged_key = f"{STAGING_PREFIX}:{self.generation}:{len(self.staged)}"
+        self.staged.append((staged_key, key))
+        _queue_write(self.pipe, staged_key, value, ttl=STAGING_TTL)
+        self.summary["bytes_written"] += value_size(value)
+        self.pending += 1
+        if self.pending >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """Sends the staged entries still queued in the pipeline."""
+        if self.pending:
+            self.pipe.execute()
+            self.summary["round_trips"] += 1
+            self.pending = 0
+
+    def commit(self):
+        """
+        Swaps the staged entries in and deletes the keys no longer present, in
+        one transaction. If any staged key is gone, nothing is applied and
+        StagingExpired is raised, so the next run redoes the whole publish.
+        Returns a summary dict with the generation now visible to readers, the
+        keys added, changed, removed and left unchanged, the Redis round trips
+        made and the payload bytes written.
+        """
+        self.flush()
+        removed = [key for key in self.previous if key not in self.digests]
+        self.summary["removed"] = len(removed)
+        if not (self.staged or removed):
+            published = self.redis_client.get(PUBLISHED_KEY)
+            self.summary["generation"] = int(published) if published is not None else None
+            self.summary["round_trips"] += 1
+            return self.summary
+
+        if self.generation is None:
+            self.generation = self.redis_client.incr(GENERATION_KEY)
+            self.summary["round_trips"] += 1
+
+        staged_keys = [staged_key for staged_key, _ in self.staged]
+        if staged_keys:
+            # Give a slow run's staged keys a fresh TTL, and find any that already expired
+            refresh = self.redis_client.pipeline(transaction=False)
+            for staged_key in staged_keys:
+                refresh.expire(staged_key, STAGING_TTL)
+            missing = [key for (_, key), refreshed in zip(self.staged, refresh.execute()) if not refreshed]
+            self.summary["round_trips"] += 1
+            if missing:
+                raise StagingExpired(f"{len(missing)} staged keys expired before the publish, e.g. {missing[0]}")
+
+        def publish(pipe):
+            # MULTI/EXEC does not roll back a failed RENAME, so every staged key is
+            # checked under WATCH first: the swap happens entirely or not at all
+            if staged_keys and pipe.exists(*staged_keys) != len(staged_keys):
+                raise StagingExpired(f"Staged keys of generation {self.generation} expired before the publish")
+            pipe.multi()
+            for staged_key, key in self.staged:
+                pipe.rename(staged_key, key)
+                pipe.persist(key)  # RENAME carries the staging TTL over
+            if removed:
+                pipe.delete(*removed)
+                pipe.hdel(DIGESTS_KEY, *removed)
+            if self.staged:
+                pipe.hset(DIGESTS_KEY, mapping={key: self.digests[key] for _, key in self.staged})
+            pipe.set(PUBLISHED_KEY, self.generation)
+
+        self.redis_client.transaction(publish, *staged_keys)
+        self.summary["round_trips"] += 2  # WATCH/EXISTS, then MULTI/EXEC
+        self.summary["generation"] = self.generation
+        return self.summary
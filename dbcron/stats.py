@@ -0,0 +1,116 @@
+"""
+Class-wide assignment statistics computed once per sync.
+
+The admin /stats route used to fetch every student key and aggregate them on
+each request. update_redis now vectorizes the roster's scores into a NumPy
+matrix (students x assignments, NaN where there is no numeric score) and
+stores, next to the student keys:
+
+    Stats          count, average, min, max, median, p25, p75, p90, std and a
+                   1-point histogram (start 0) for every assignment
+
+keyed by the JSON array [section, name] (JSON.stringify-compatible), with name
+null for a section's summary, so the route answers with one HGET.
+
+The /admin/stats and /admin/distribution routes answer from this hash alone.
+The students in a histogram bucket are only listed when staff select that
+bucket, from the "Score Matrix" and roster keys.
+"""
+import json
+import math
+import warnings
+
+import numpy as np
+
+MAX_HISTOGRAM_BUCKETS = 1000  # the distribution route refuses wider ranges
+
+
+def stats_field(section, name):
+    """The hash field for an assignment; name is None for the section summary."""
+    return json.dumps([section, name], separators=(",", ":"), ensure_ascii=False)
+
+
+def score_columns(categories, concepts):
+    """The distinct (category, concept) pairs of the header rows, in sheet order."""
+    return list(dict.fromkeys(zip(categories, concepts)))
+
+
+def section_matrix(students, sections):
+    """
+    Builds a float matrix of the precomputed section totals, one row per
+    student and one column per section, with NaN where a student has none.
+    """
+    matrix = np.full((len(students), len(sections)), np.nan)
+    for row, (_, student) in enumerate(students):
+        totals = student["Aggregates"]["Section Totals"]
+        for col, section in enumerate(sections):
+            if totals.get(section) is not None:
+                matrix[row, col] = totals[section]
+    return matrix
+
+
+def _number(value):
+    """Converts a NumPy scalar to an int when integral, so JSON matches the API's numbers."""
+    value = float(value)
+    return int(value) if value.is_integer() else value
+
+
+def column_stats(matrix):
+    """
+    Computes the summary statistics of every column of matrix at once.
+    Returns one dict per column; columns without scores get count 0 only.
+    """
+    counts = np.count_nonzero(~np.isnan(matrix), axis=0)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", category=RuntimeWarning)  # all-NaN columns
+        means = np.nanmean(matrix, axis=0)
+        mins = np.nanmin(matrix, axis=0)
+        maxes = np.nanmax(matrix, axis=0)
+        stds = np.nanstd(matrix, axis=0)
+        p25, p50, p75, p90 = np.nanpercentile(matrix, [25, 50, 75, 90], axis=0)
+
+    result = []
+    for col in range(matrix.shape[1]):
+        if counts[col] == 0:
+            result.append({"count": 0})
+            continue
+        scores = matrix[:, col][~np.isnan(matrix[:, col])]
+        buckets = min(max(int(math.floor(maxes[col])) + 1, 1), MAX_HISTOGRAM_BUCKETS)
+        indexes = np.clip(np.floor(scores).astype(np.int64), 0, buckets - 1)
+        result.append({
+            "count": int(counts[col]),
+            "average": float(means[col]),
+            "min": _number(mins[col]),
+            "max": _number(maxes[col]),
+            "median": float(p50[col]),
+            "p25": float(p25[col]),
+            "p75": float(p75[col]),
+            "p90": float(p90[col]),
+            "std": float(stds[col]),
+            "histogram": {
+                "start": 0,
+                "binWidth": 1,
+                "freq": np.bincount(indexes, minlength=buckets).tolist(),
+            },
+        })
+    return result
+
+
+def assignment_stats(students, columns, scores):
+    """
+    Computes the Stats hash for the roster.
+
+    students is a list of (email, entry) pairs, entry holding at least the
+    student's "Aggregates"; columns and scores are the matrix's columns and
+    its students x columns scores (NaN where there is no score).
+    Returns a dict of hash field -> JSON string.
+    """
+    sections = list(dict.fromkeys(category for category, _ in columns))
+    totals = section_matrix(students, sections)
+
+    stats = {}
+    for (category, concept), column_summary in zip(columns, column_stats(scores)):
+        stats[stats_field(category, concept)] = json.dumps(column_summary)
+    for section, column_summary in zip(sections, column_stats(totals)):
+        stats[stats_field(section, None)] = json.dumps(column_summary)
+    return stats
@@ -0,0 +1,133 @@
+"""
+Resident scheduler for the dbcron jobs.
+
+Replaces the cron lines that started a fresh python3 process per tick. Both
+jobs are imported once, so they share the authorized gspread client, its OAuth
+token and the Redis connection pools from clients.py. Every course of the
+registry (see courses.py) gets its own pair of jobs in this one process. The
+due jobs of different courses run concurrently on a pool of up to SYNC_WORKERS
+threads (see sync_runner.py), sharing the process-wide Sheets rate limit; a
+course's own jobs run one at a time, so two syncs of one course never overlap.
+
+Configuration (seconds):
+    UPDATE_DB_INTERVAL     gradebook sync interval (default 300)
+    UPDATE_BINS_INTERVAL   bins sync interval (default 1800)
+    SCHEDULER_JITTER       random delay added to each run (default 15)
+    SCHEDULER_RETRY_BASE   first retry delay after a failure (default 30)
+    SCHEDULER_RETRY_MAX    longest retry delay, doubled per consecutive
+                           failure up to this cap (default 1800)
+"""
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+import functools
+import os
+import random
+import signal
+import threading
+import time
+import traceback
+
+from courses import load_courses
+from sync_runner import SYNC_WORKERS, run_sync
+from update_bins import update_bins
+from update_db import update_redis
+
+load_dotenv()
+
+UPDATE_DB_INTERVAL = int(os.getenv("UPDATE_DB_INTERVAL", "300"))
+UPDATE_BINS_INTERVAL = int(os.getenv("UPDATE_BINS_INTERVAL", "1800"))
+SCHEDULER_JITTER = float(os.getenv("SCHEDULER_JITTER", "15"))
+SCHEDULER_RETRY_BASE = float(os.getenv("SCHEDULER_RETRY_BASE", "30"))
+SCHEDULER_RETRY_MAX = float(os.getenv("SCHEDULER_RETRY_MAX", "1800"))
+
+stop_event = threading.Event()
+wake_event = threading.Event()  # set when a job finishes or the daemon is stopped
+
+
+class Job:
+    def __init__(self, name, run, interval, course=None):
+        self.name = name
+        self.run = run
+        self.interval = interval
+        self.course = course  # jobs of the same course never run at the same time
+        self.failures = 0
+        self.next_run = time.monotonic()
+
+    def next_delay(self):
+        """Seconds until the next run: the interval after a success, backoff after a failure."""
+        if self.failures:
+            delay = min(SCHEDULER_RETRY_BASE * 2 ** (self.failures - 1), SCHEDULER_RETRY_MAX)
+        else:
+            delay = self.interval
+        return delay + random.uniform(0, SCHEDULER_JITTER)
+
+
+def run_job(job, force=False):
+    started = time.monotonic()
+    print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] Running {job.name}", flush=True)
+    try:
+        job.run(force=force)
+        job.failures = 0
+    except Exception:
+        job.failures += 1
+        traceback.print_exc()
+        print(f"{job.name} failed ({job.failures} in a row)", flush=True)
+    job.next_run = time.monotonic() + job.next_delay()
+    print(f"{job.name} finished in {time.monotonic() - started:.1f}s, "
+          f"next run in {job.next_run - time.monotonic():.0f}s", flush=True)
+
+
+def run_forever(jobs, courses):
+    # Cold start: sync everything regardless of the recorded revisions, with
+    # the sheet downloads overlapping.
+    # A failure is retried with the jobs' backoff rather than an interval
+    # later; jobs that did sync only recheck the revision on the retry.
+    try:
+        run_sync(force=True, courses=courses)
+    except Exception:
+        traceback.print_exc()
+        for job in jobs:
+            job.failures = 1
+    for job in jobs:
+        job.next_run = time.monotonic() + job.next_delay()
+
+    running = {}  # course -> future of the job it is running
+    with ThreadPoolExecutor(max_workers=max(1, min(SYNC_WORKERS, len(courses)))) as executor:
+        while not stop_event.is_set():
+            wake_event.clear()
+            running = {course: future for course, future in running.items() if not future.done()}
+            now = time.monotonic()
+            for job in sorted(jobs, key=lambda j: j.next_run):
+                if job.next_run > now:
+                    break
+                if job.course not in running:
+                    running[job.course] = executor.submit(run_job, job)
+                    running[job.course].add_done_callback(lambda _: wake_event.set())
+            # Sleep until an idle course has a job due; a course that is busy is
+            # looked at again when its job finishes
+            waiting = [job.next_run for job in jobs if job.course not in running]
+            wake_event.wait(max(0, min(waiting) - time.monotonic()) if waiting else None)
+
+
+def main():
+    def stop(signum, frame):
+        print(f"Received signal {signum}, stopping after the current jobs", flush=True)
+        stop_event.set()
+        wake_event.set()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    courses = load_courses()
+    jobs = []
+    for course in courses:
+        suffix = f" ({course.name})" if len(courses) > 1 else ""
+        jobs += [
+            Job(f"update_redis{suffix}", functools.partial(update_redis, course=course), UPDATE_DB_INTERVAL, course.name),
+            Job(f"update_bins{suffix}", functools.partial(update_bins, course=course), UPDATE_BINS_INTERVAL, course.name),
+        ]
+    run_forever(jobs, courses)
+
+
+if __name__ == "__main__":
+    main()
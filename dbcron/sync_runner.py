@@ -0,0 +1,75 @@
+"""
+Full sync of every course's gradebook and grade bins with overlapping fetches.
+
+The jobs read different worksheets and write different Redis DBs, so their
+Sheets downloads are independent. The fetches of all courses run on one thread
+pool (SYNC_WORKERS threads), all drawing on the process-wide Sheets rate limit
+in ratelimit.py. The commits follow once the fetches have returned, so a cold
+reload takes roughly as long as the slowest fetch instead of the sum of them.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import os
+import time
+
+from courses import load_courses
+from update_bins import fetch_bins, update_bins
+from update_db import fetch_gradebook, update_redis
+
+SYNC_WORKERS = int(os.getenv("SYNC_WORKERS", "8"))
+
+
+def _timed(timings, stage, func, *args, **kwargs):
+    started = time.perf_counter()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        timings[stage] = time.perf_counter() - started
+
+
+def run_sync(force=False, courses=None):
+    """
+    Fetches both sheets of every course concurrently, then commits each to
+    Redis. courses defaults to the whole registry (see courses.py). Returns the
+    per-stage timings in seconds, keyed "<course>:<stage>" when there are
+    several courses. A failure in one job does not stop the others; the first
+    error is re-raised once all have been attempted.
+    """
+    courses = courses or load_courses()
+    timings = {}
+    started = time.perf_counter()
+
+    def stage(course, name):
+        return f"{course.name}:{name}" if len(courses) > 1 else name
+
+    with ThreadPoolExecutor(max_workers=max(1, min(SYNC_WORKERS, 2 * len(courses)))) as executor:
+        futures = [
+            (course,
+             executor.submit(_timed, timings, stage(course, "fetch_gradebook"), fetch_gradebook, force, course),
+             executor.submit(_timed, timings, stage(course, "fetch_bins"), fetch_bins, force, course))
+            for course in courses
+        ]
+
+    # Bins first: the gradebook commit grades students against them.
+    errors = []
+    for course, gradebook_future, bins_future in futures:
+        for name, future, commit in [
+            ("bins", bins_future, update_bins),
+            ("gradebook", gradebook_future, update_redis),
+        ]:
+            try:
+                fetched = future.result()
+                if fetched is not None:
+                    _timed(timings, stage(course, f"commit_{name}"), commit, force=force, fetched=fetched, course=course)
+            except Exception as e:
+                print(f"Syncing {name} of {course.name} failed: {e}")
+                errors.append(e)
+
+    timings["total"] = time.perf_counter() - started
+    print("Sync timings: " + ", ".join(f"{label}={seconds:.2f}s" for label, seconds in timings.items()))
+    if errors:
+        raise errors[0]
+    return timings
+
+
+if __name__ == "__main__":
+    run_sync(force=True)
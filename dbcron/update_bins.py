@@ -1,61 +1,117 @@
-import gspread
-from google.oauth2.service_account import Credentials
 from dotenv import load_dotenv
+import argparse
 import json
-import os
-import redis
+from gspread.utils import rowcol_to_a1
+
+from clients import get_sheets_client
+from courses import default_course, find_course
+from metrics import job_metrics
+from ratelimit import reset_request_budget
+from revision import check_revision, record_revision
 
 load_dotenv()
 
-PORT = int(os.getenv("SERVER_PORT"))
-SCOPES = json.loads(os.getenv("SPREADSHEET_SCOPES"))
-HOST = os.getenv("SERVER_HOST")
-DB = int(os.getenv("BINS_DBINDEX"))
-SPREADSHEET_ID = os.getenv("SPREADSHEET_ID")  # Fixed: Use SPREADSHEET_ID
-SHEETNAME = os.getenv("SPREADSHEET_SHEETNAME")  # This is the sheet/tab name
-WORKSHEET = int(os.getenv("BINS_WORKSHEET"))
+client = get_sheets_client()
+
+def fetch_rows(sheet, row_ranges, last_col):
+    """
+    Reads several row ranges of a worksheet in a single batch_get call.
+    row_ranges is a list of (start_row, end_row) pairs (1-indexed, inclusive)
+    and last_col the 0-indexed last column to read. Returns one dict per range
+    mapping row number to its values, with the same shape row_values returns;
+    rows the API omits because they are empty are simply absent.
+    """
+    a1_ranges = [
+        f"{rowcol_to_a1(start_row, 1)}:{rowcol_to_a1(end_row, last_col + 1)}"
+        for start_row, end_row in row_ranges
+    ]
+    value_ranges = sheet.batch_get(a1_ranges)
+    return [
+        {start_row + offset: list(row) for offset, row in enumerate(values)}
+        for (start_row, _), values in zip(row_ranges, value_ranges)
+    ]
 
-REDIS_PW = os.getenv("REDIS_DB_SECRET")
+def read_constants(course):
+    """
+    Reads the bins and assignment-points ranges of the Constants sheet in one
+    batch_get. Returns (bins_rows, assignment_rows).
+    """
+    constants_sheet = client.open_by_key(course.spreadsheet_id).worksheet('Constants')
+    print("Successfully opened Constants sheet!")
+    return fetch_rows(
+        constants_sheet,
+        [(course.bins_start_row, course.bins_end_row),
+         (course.assignment_points_start_row, course.assignment_points_end_row)],
+        last_col=max(course.bins_points_col, course.bins_grades_col, 1),
+    )
 
-#needs both spreadsheet and drive access or else there is a permissions error, added as a viewer on the spreadsheet
-credentials_json = os.getenv("SERVICE_ACCOUNT_CREDENTIALS")
-credentials_dict = json.loads(credentials_json)
-credentials = Credentials.from_service_account_info(credentials_dict, scopes=SCOPES)
-client = gspread.authorize(credentials)
+def fetch_bins(force=False, course=None):
+    """
+    The network half of update_bins. Returns (bins_rows, assignment_rows, revision)
+    to pass to update_bins as fetched, or None if the spreadsheet is unchanged.
+    """
+    course = course or default_course()
+    redis_client = course.bins_client
+    metrics = job_metrics("update_bins", course.name, new=True)
+    reset_request_budget()
+    try:
+        should_fetch, revision = check_revision(client, redis_client, course.spreadsheet_id, force=force)
+        metrics.lap("revision_check", api_calls=1)
+        if not should_fetch:
+            print(f"Spreadsheet unchanged since last bins update (revision {revision}), skipping")
+            metrics.finish(redis_client, success=True, skipped=True)
+            return None
+        bins_rows, assignment_rows = read_constants(course)
+        metrics.lap("sheets_fetch", rows=len(bins_rows) + len(assignment_rows), api_calls=1)
+        return bins_rows, assignment_rows, revision
+    except Exception:
+        metrics.finish(redis_client, success=False)
+        raise
 
-#redis setup
-if HOST == "redis":  # If running in Docker
-    redis_client = redis.Redis(host=HOST, port=PORT, db=DB, password=REDIS_PW)
-else:  # If running locally
-    redis_client = redis.Redis(host="localhost", port=6379, db=DB, password=REDIS_PW)
+def update_bins(force=False, fetched=None, course=None):
+    """
+    Syncs the grade bins from the Constants sheet into Redis. fetched is the
+    result of an earlier fetch_bins call when the caller already downloaded the
+    sheet (see sync_runner.py); otherwise fetch_bins is called here. course
+    defaults to the first course of the registry (see courses.py).
+    """
+    course = course or default_course()
+    redis_client = course.bins_client
+    if fetched is None:
+        fetched = fetch_bins(force, course) #finishes the run's metrics itself on a skip or failure
+        if fetched is None:
+            return
+    metrics = job_metrics("update_bins", course.name)
+    metrics.mark()
+    bins_rows, assignment_rows, revision = fetched
 
-def update_bins():
     print("Updating Bins from production spreadsheet...")
-    print(f"Spreadsheet ID: {SPREADSHEET_ID}")
-    print(f"Sheet name: {SHEETNAME}")
+    print(f"Course: {course.name}")
+    print(f"Spreadsheet ID: {course.spreadsheet_id}")
+    print(f"Sheet name: {course.sheet_name}")
     
     try:
         # Try to read grade bins dynamically from the Constants sheet
         # This follows the original design where bins are stored in the spreadsheet
         grade_bins = []
         assignment_points = {}
+        fallback = False  # the standard bins below are percentages, not the course's point bins
         
         try:
-            constants_sheet = client.open_by_key(SPREADSHEET_ID).worksheet('Constants')
-            print("Successfully opened Constants sheet!")
-            
             # Read grade bins from the configured range (A51:B61 as per config)
             # This should contain point thresholds and letter grades
             print("Reading grade bins from configured range...")
             
             # Read the bins data from the configured range
-            start_row = int(os.getenv("BINS_START_ROW", "51"))
-            end_row = int(os.getenv("BINS_END_ROW", "61"))
-            points_col = int(os.getenv("BINS_POINTS_COL", "0"))  # Column A
-            grades_col = int(os.getenv("BINS_GRADES_COL", "1"))  # Column B
+            start_row, end_row = course.bins_start_row, course.bins_end_row
+            points_col, grades_col = course.bins_points_col, course.bins_grades_col
+            # Also read assignment points for reference
+            assignment_start_row, assignment_end_row = course.assignment_points_start_row, course.assignment_points_end_row
             
             print(f"Reading bins from row {start_row} to {end_row}")
             
+            # Both blocks were read in one API call by fetch_bins; everything below works on these rows
+            
             # VALIDATION: Check bins page structure
             print("\n" + "="*60)
             print("BINS PAGE STRUCTURE VALIDATION")
@@ -64,12 +120,9 @@ def update_bins():
             # Read a sample of rows to validate structure
             sample_rows = []
             for row in range(start_row, min(start_row + 5, end_row + 1)):
-                try:
-                    row_values = constants_sheet.row_values(row)
-                    if len(row_values) > max(points_col, grades_col):
-                        sample_rows.append((row, row_values))
-                except:
-                    pass
+                row_values = bins_rows.get(row, [])
+                if len(row_values) > max(points_col, grades_col):
+                    sample_rows.append((row, row_values))
             
             if sample_rows:
                 print(f"\nSample of bins data (first {len(sample_rows)} rows):")
@@ -83,17 +136,14 @@ def update_bins():
             # Check if points column has numeric values
             points_are_numeric = True
             for row in range(start_row, end_row + 1):
-                try:
-                    row_values = constants_sheet.row_values(row)
-                    if len(row_values) > points_col and row_values[points_col]:
-                        try:
-                            float(row_values[points_col])
-                        except (ValueError, TypeError):
-                            points_are_numeric = False
-                            bins_structure_warnings.append(f"Row {row}: Points value '{row_values[points_col]}' is not numeric")
-                            break
-                except:
-                    pass
+                row_values = bins_rows.get(row, [])
+                if len(row_values) > points_col and row_values[points_col]:
+                    try:
+                        float(row_values[points_col])
+                    except (ValueError, TypeError):
+                        points_are_numeric = False
+                        bins_structure_warnings.append(f"Row {row}: Points value '{row_values[points_col]}' is not numeric")
+                        break
             
             if points_are_numeric:
                 print("✓ Points column contains numeric values")
@@ -104,16 +154,13 @@ def update_bins():
             grade_format_valid = True
             expected_grades = ['F', 'D', 'D-', 'D+', 'C-', 'C', 'C+', 'B-', 'B', 'B+', 'A-', 'A', 'A+']
             for row in range(start_row, end_row + 1):
-                try:
-                    row_values = constants_sheet.row_values(row)
-                    if len(row_values) > grades_col and row_values[grades_col]:
-                        grade = str(row_values[grades_col]).strip()
-                        # Check if it looks like a letter grade
-                        if not any(g in grade for g in expected_grades):
-                            grade_format_valid = False
-                            bins_structure_warnings.append(f"Row {row}: Grade '{grade}' may not be a valid letter grade")
-                except:
-                    pass
+                row_values = bins_rows.get(row, [])
+                if len(row_values) > grades_col and row_values[grades_col]:
+                    grade = str(row_values[grades_col]).strip()
+                    # Check if it looks like a letter grade
+                    if not any(g in grade for g in expected_grades):
+                        grade_format_valid = False
+                        bins_structure_warnings.append(f"Row {row}: Grade '{grade}' may not be a valid letter grade")
             
             if grade_format_valid:
                 print("✓ Grades column contains letter grades")
@@ -124,7 +171,7 @@ def update_bins():
             
             for row in range(start_row, end_row + 1):
                 try:
-                    row_values = constants_sheet.row_values(row)
+                    row_values = bins_rows.get(row, [])
                     
                     # Skip empty rows
                     if len(row_values) <= max(points_col, grades_col) or not row_values[points_col] or not row_values[grades_col]:
@@ -258,16 +305,11 @@ def update_bins():
                     {"letter": "F", "points": 0}
                 ]
                 print("Using standard grade bins as fallback")
+                fallback = True
             
-            # Also read assignment points for reference
-            # NOTE: This reads from rows 16-50 in the Constants sheet
-            # Format: Column A = Assignment name, Column B = Points
-            # This should contain the high-level grading breakdown (Quest, Midterm, Projects, Labs, etc.)
-            assignment_start_row = int(os.getenv("ASSIGNMENT_POINTS_START_ROW", "16"))
-            assignment_end_row = int(os.getenv("ASSIGNMENT_POINTS_END_ROW", "50"))
-            
+            # Assignment points were fetched alongside the bins above
             for row in range(assignment_start_row, assignment_end_row + 1):
-                row_values = constants_sheet.row_values(row)
+                row_values = assignment_rows.get(row, [])
                 if len(row_values) >= 2 and row_values[0] and row_values[1]:
                     try:
                         assignment_name = row_values[0].strip()
@@ -294,6 +336,7 @@ def update_bins():
         except Exception as sheet_error:
             print(f"Error reading from Constants sheet: {sheet_error}")
             print("Using standard grade bins as fallback")
+            fallback = True
             # Fallback to standard bins
             grade_bins = [
                 {"letter": "A", "points": 90},
@@ -307,11 +350,16 @@ def update_bins():
         bins_data = {
             "bins": grade_bins,
             "assignment_points": assignment_points,
-            "total_course_points": sum(assignment_points.values()) if assignment_points else 0
+            "total_course_points": sum(assignment_points.values()) if assignment_points else 0,
+            "fallback": fallback
         }
         
         bins_json = json.dumps(bins_data)
+        metrics.lap("parse", rows=len(grade_bins) + len(assignment_points))
         redis_client.set("bins", bins_json)
+        if not fallback: #unrecorded, the revision is read again next run until the sheet has bins
+            record_revision(redis_client, revision)
+        metrics.lap("redis_write", rows=1, api_calls=1 if fallback else 2, bytes_written=len(bins_json))
         print(f"Successfully updated bins in Redis with {len(grade_bins)} grade bins!")
         print("Bins are now DYNAMIC and will update when you change the spreadsheet!")
         
@@ -325,11 +373,13 @@ def update_bins():
             print(f"✓ {len(assignment_points)} assignment points loaded")
             print(f"✓ Total course points: {sum(assignment_points.values())}")
         print("="*60 + "\n")
+        metrics.finish(redis_client, success=not fallback) #fallback bins are not a successful sync
         
     except Exception as e:
         print(f"Error updating bins: {e}")
-        print(f"Spreadsheet ID: {SPREADSHEET_ID}")
-        print(f"Sheet name: {SHEETNAME}")
+        print(f"Course: {course.name}")
+        print(f"Spreadsheet ID: {course.spreadsheet_id}")
+        print(f"Sheet name: {course.sheet_name}")
         # Store default bins to prevent errors
         default_bins = {
             "bins": [
@@ -340,10 +390,16 @@ def update_bins():
                 {"letter": "F", "points": 0}
             ],
             "assignment_points": {},
-            "total_course_points": 0
+            "total_course_points": 0,
+            "fallback": True
         }
         redis_client.set("bins", json.dumps(default_bins))
         print("Stored default bins to prevent errors")
+        metrics.finish(redis_client, success=False)
 
 if __name__ == "__main__":
-    update_bins()
+    arg_parser = argparse.ArgumentParser(description="Sync the grade bins from the Constants sheet into Redis.")
+    arg_parser.add_argument("--force", action="store_true", help="update even if the spreadsheet is unchanged")
+    arg_parser.add_argument("--course", help="course to sync (see courses.py); defaults to the first one")
+    args = arg_parser.parse_args()
+    update_bins(force=args.force, course=find_course(args.course) if args.course else None)
@@ -1,46 +1,112 @@
-import gspread
-from google.oauth2.service_account import Credentials
 from dotenv import load_dotenv
+import argparse
+import itertools
 import json
+import numpy as np
 import os
-import redis
+
+from aggregates import student_aggregates
+from clients import get_sheets_client
+from columnar import score_matrix_entries, write_score_matrix_files
+from courses import default_course, find_course
+from gradebook import RowStream, fetch_values, parse_gradebook, row_chunks
+from layout import sheet_layout
+from metrics import job_metrics
+from normalize import MAX_REPORTED_CELLS, VALIDATION_REPORT_KEY, normalize_scores, validation_report
+from ratelimit import request_budget, reset_request_budget
+from records import SCHEMA_KEY, STUDENT_ENCODING, encode_student
+from revision import check_revision, ensure_revision, record_revision
+from roster import roster_entries
+from snapshot import SnapshotWriter, digest
+from stats import assignment_stats
 
 load_dotenv()
 
-PORT = int(os.getenv("SERVER_PORT"))
-SCOPES = json.loads(os.getenv("SPREADSHEET_SCOPES"))
-HOST = os.getenv("SERVER_HOST")
-DB = int(os.getenv("SERVER_DBINDEX"))
-SPREADSHEET_ID = os.getenv("SPREADSHEET_ID")  # Fixed: Use SPREADSHEET_ID
-SHEETNAME = os.getenv("SPREADSHEET_SHEETNAME")  # This is the sheet/tab name
-WORKSHEET = int(os.getenv("SPREADSHEET_WORKSHEET"))
-CATEGORYCOL = int(os.getenv("ASSIGNMENT_CATEGORYCOL"))
-CATEGORYROW = int(os.getenv("ASSIGNMENT_CATEGORYROW"))
-CONCEPTSCOL = int(os.getenv("ASSIGNMENT_CONCEPTSCOL"))
-CONCEPTSROW = int(os.getenv("ASSIGNMENT_CONCEPTSROW"))
-MAXPOINTSROW = int(os.getenv("ASSIGNMENT_MAXPOINTSROW"))
-MAXPOINTSCOL = int(os.getenv("ASSIGNMENT_MAXPOINTSCOL"))
-REDIS_PW = os.getenv("REDIS_DB_SECRET")
-
-#needs both spreadsheet and drive access or else there is a permissions error, added as a viewer on the spreadsheet
-credentials_json = os.getenv("SERVICE_ACCOUNT_CREDENTIALS")
-credentials_dict = json.loads(credentials_json)
-credentials = Credentials.from_service_account_info(credentials_dict, scopes=SCOPES)
-client = gspread.authorize(credentials)
-
-#redis setup
-if HOST == "redis":  # If running in Docker
-    redis_client = redis.Redis(host=HOST, port=PORT, db=DB, password=REDIS_PW)
-else:  # If running locally
-    redis_client = redis.Redis(host="localhost", port=6379, db=DB, password=REDIS_PW)
-
-def update_redis():
+REDIS_WRITE_CHUNK_SIZE = int(os.getenv("REDIS_WRITE_CHUNK_SIZE", "500"))  # Keys sent per pipeline round trip
+
+client = get_sheets_client()
+
+def load_bins(course):
+    """
+    Returns the grade bins stored by update_bins and a digest of them, so a
+    bins change alone is enough to rerun the sync and regrade everyone. The
+    fallback bins update_bins stores when it cannot read the Constants sheet
+    are returned as no bins, so nobody is graded against them.
+    """
+    bins_json = course.bins_client.get("bins")
+    if bins_json is None:
+        return [], None
+    bins_data = json.loads(bins_json)
+    if bins_data.get("fallback"):
+        return [], digest(bins_json)
+    return bins_data.get("bins", []), digest(bins_json)
+
+def fetch_gradebook(force=False, course=None):
+    """
+    The network half of update_redis. Returns (values, revision) to pass to
+    update_redis as fetched, or None if the spreadsheet is unchanged.
+    """
+    course = course or default_course()
+    redis_client = course.redis_client
+    metrics = job_metrics("update_redis", course.name, new=True)
+    reset_request_budget()
     try:
-        sheet = client.open_by_key(SPREADSHEET_ID).worksheet(SHEETNAME)
-        
-        categories = sheet.row_values(CATEGORYROW)[CATEGORYCOL:] #gets the categories from row 2, starting from column C
-        concepts = sheet.row_values(CONCEPTSROW)[CONCEPTSCOL:] #gets the concepts from row 1, starting from column C
-        max_points = sheet.row_values(MAXPOINTSROW)[MAXPOINTSCOL:] #gets the max points from row 3, starting from column C
+        _, bins_digest = load_bins(course)
+        should_fetch, revision = check_revision(client, redis_client, course.spreadsheet_id, force=force, extra=bins_digest)
+        metrics.lap("revision_check", api_calls=1)
+        if not should_fetch:
+            print(f"Spreadsheet and bins unchanged since last sync (revision {revision}), skipping")
+            metrics.finish(redis_client, success=True, skipped=True)
+            return None
+        sheet = client.open_by_key(course.spreadsheet_id).worksheet(course.sheet_name)
+        #the only Sheets read for this worksheet, or its first rows when GRADEBOOK_CHUNK_ROWS is set
+        values = fetch_values(sheet, head_rows=max(course.category_row, course.concepts_row, course.max_points_row))
+        metrics.lap("sheets_fetch", rows=len(values.head if isinstance(values, RowStream) else values), api_calls=1)
+        return values, revision
+    except Exception:
+        metrics.finish(redis_client, success=False)
+        raise
+
+def update_redis(force=False, fetched=None, course=None):
+    """
+    Syncs the gradebook worksheet into Redis. Unless force is set, the sync is
+    skipped when the spreadsheet has not changed since the last successful one;
+    force also rewrites every key instead of only the changed ones. fetched is
+    the result of an earlier fetch_gradebook call when the caller already
+    downloaded the sheet (see sync_runner.py). course defaults to the first
+    course of the registry (see courses.py).
+
+    The rows are processed, and their keys staged in Redis, one chunk at a
+    time: the whole sheet when it was read in one call, GRADEBOOK_CHUNK_ROWS
+    rows at a time when streaming (see gradebook.py). Besides the chunk in
+    hand, only what the class-wide keys need is kept: each student's name,
+    aggregates and float scores. A streamed sheet is only published if its
+    revision did not change while it was read; otherwise the run fails with
+    RevisionChanged and the staged keys expire unpublished.
+    """
+    course = course or default_course()
+    redis_client = course.redis_client
+    metrics = None
+    try:
+        if fetched is None:
+            fetched = fetch_gradebook(force, course) #finishes the run's metrics itself on a skip or failure
+            if fetched is None:
+                return
+        metrics = job_metrics("update_redis", course.name)
+        metrics.mark()
+        values, revision = fetched
+        bins, bins_digest = load_bins(course) #read at commit time so grades use the latest bins
+
+        gradebook = parse_gradebook(
+            values,
+            category_row=course.category_row, category_col=course.category_col,
+            concepts_row=course.concepts_row, concepts_col=course.concepts_col,
+            max_points_row=course.max_points_row, max_points_col=course.max_points_col,
+        )
+
+        categories = gradebook["categories"] #the categories from row 2, starting from column C
+        concepts = gradebook["concepts"] #the concepts from row 1, starting from column C
+        max_points = gradebook["max_points"] #the max points from row 3, starting from column C
 
         category_scores = {}
         for category, concept, points in zip(categories, concepts, max_points):
@@ -48,14 +114,15 @@ def update_redis():
                 category_scores[category] = {} #creates a hashmap entry for each category
             category_scores[category][concept] = points #nested hashmap of     category:concept:points
 
-        redis_client.set("Categories", json.dumps(category_scores)) #the one record that holds all of the categories info
+        writer = SnapshotWriter(redis_client, REDIS_WRITE_CHUNK_SIZE, full=force)
+        writer.add("Categories", json.dumps(category_scores)) #the one record that holds all of the categories info
 
         # VALIDATION: Check spreadsheet structure
         validation_warnings = []
         validation_errors = []
         
         # Check header row structure
-        header_row = sheet.row_values(1)  # Row 1 is header for get_all_records()
+        header_row = gradebook["header"]  # Row 1 is the header the records are keyed by
         
         # Validate column structure per README requirements
         # Check: First column should be student name (can be empty header)
@@ -86,17 +153,13 @@ def update_redis():
         if len(categories) == 0 or len(concepts) == 0:
             validation_warnings.append(f"Found {len(categories)} categories and {len(concepts)} concepts (expected > 0)")
         
-        records = sheet.get_all_records()
+        chunks = row_chunks(values, gradebook["fields"])
+        first_rows = next((chunk for chunk in chunks if chunk), []) #the first chunk with any rows
         
-        # Determine the name column - try multiple strategies
-        # get_all_records() uses the first row as headers, so check what keys we have
-        if len(records) == 0:
+        if len(first_rows) == 0:
             validation_errors.append("No student records found in spreadsheet")
             raise ValueError("No records found in spreadsheet")
         
-        # Get the available column keys from the first record
-        available_keys = list(records[0].keys())
-        
         # Print validation results (only errors and warnings)
         if validation_errors:
             print("\n" + "="*60)
@@ -114,59 +177,111 @@ def update_redis():
                 print(f"  ⚠️  {warning}")
             print("="*60 + "\n")
         
-        name_column_key = None
-        
-        # Strategy 1: Check if 'Legal Name' exists
-        if 'Legal Name' in available_keys:
-            name_column_key = 'Legal Name'
-        # Strategy 2: Check for empty string (common when column A has no header)
-        elif '' in available_keys and available_keys[0] == '':
-            name_column_key = ''
-        # Strategy 3: Use the first column as fallback (before Email)
-        elif len(available_keys) > 0:
-            # Find Email column index
-            email_index = available_keys.index('Email') if 'Email' in available_keys else -1
-            # If Email is in column B (index 1), then column A (index 0) is likely the name
-            if email_index == 1:
-                name_column_key = available_keys[0]
-            else:
-                # Last resort: use first column
-                name_column_key = available_keys[0]
-        
-        if name_column_key is None:
-            raise ValueError("Could not determine name column. Please ensure the spreadsheet has a name column in the first column.")
-
-        for record in records:
-            email = record.pop('Email')
-            # Safely get the legal name using the determined key
-            legal_name = record.pop(name_column_key, None)
-            if legal_name is None:
-                # Last resort: try to get from first column by index
-                first_col_value = list(record.values())[0] if record else None
-                legal_name = first_col_value or "Unknown"
-            
-            if email == "CATEGORY":
-                continue
-            users_to_assignments = { #structure for db entries
-                "Legal Name": legal_name,
-                "Assignments": {}
-            }
-
-            for category, concept in zip(categories, concepts):
-                if category not in users_to_assignments["Assignments"]:
-                    users_to_assignments["Assignments"][category] = {}
-                users_to_assignments["Assignments"][category][concept] = record[concept]
-
-            redis_client.set(email, json.dumps(users_to_assignments)) #sets key value for user:other data
-        
-        print(f"✓ Successfully updated Redis database with {len(records)} student records")
+        # Column indexes of the name, email and scores, resolved once per header
+        layout = sheet_layout(gradebook["fields"], categories, concepts)
+        columns = layout.columns
+        schema = layout.schema
+        if STUDENT_ENCODING == "positional":
+            writer.add(SCHEMA_KEY, schema.to_json())
+
+        metrics.lap("parse")
+
+        students = [] #(email, legal name and aggregates) of every student, for the class-wide keys
+        score_rows = [] #each chunk's students x columns float scores
+        issues = [] #the first MAX_REPORTED_CELLS unparseable cells
+        issue_count = 0
+        record_count = 0
+        stream_reads = 1 #the head, lapped by fetch_gradebook
+        for chunk in itertools.chain([first_rows], chunks):
+            if isinstance(values, RowStream) and values.reads > stream_reads:
+                #waiting on the stream's next reads, blank chunks included
+                metrics.lap("sheets_fetch", rows=len(chunk), api_calls=values.reads - stream_reads)
+                stream_reads = values.reads
+            record_count += len(chunk)
+
+            grid = np.array(chunk, dtype=object).reshape(len(chunk), len(layout.fields))
+            grid = grid[grid[:, layout.email_index] != "CATEGORY"]
+            emails = grid[:, layout.email_index].tolist()
+            names = grid[:, layout.name_index].tolist() if layout.name_index is not None else ["Unknown"] * len(grid)
+            cells = grid[:, layout.column_indexes] #raw score cells, students x columns
+
+            metrics.lap("parse", rows=len(grid))
+
+            # Coerce every score to a number or None in one pass over the chunk's grid
+            chunk_issues = normalize_scores(cells, emails, columns)
+            issue_count += len(chunk_issues)
+            issues.extend(chunk_issues[:MAX_REPORTED_CELLS - len(issues)])
+
+            student_rows = []
+            for index, (email, legal_name, row_scores) in enumerate(zip(emails, names, cells.tolist())):
+                users_to_assignments = { #structure for db entries
+                    "Legal Name": legal_name,
+                    "Assignments": layout.assignments(row_scores),
+                }
+                users_to_assignments["Aggregates"] = student_aggregates(users_to_assignments["Assignments"], bins)
+
+                writer.add(email, encode_student(users_to_assignments, schema)) #key value for user:other data
+                if "@" in email: #the API's roster is every key with an @
+                    students.append((email, {"Legal Name": legal_name, "Aggregates": users_to_assignments["Aggregates"]}))
+                    student_rows.append(index)
+            score_rows.append(cells[student_rows].astype(float))
+
+            metrics.lap("normalize", rows=len(grid))
+            writer.flush() #send this chunk's keys before reading the next one
+            metrics.lap("redis_write")
+
+        writer.add(VALIDATION_REPORT_KEY, validation_report(issues, count=issue_count))
+        if issue_count:
+            print(f"⚠️  {issue_count} score cells are not numbers and were stored as null "
+                  f"(see the '{VALIDATION_REPORT_KEY}' key), e.g. {issues[0]}")
+
+        scores = np.vstack(score_rows) if score_rows else np.empty((0, len(columns)))
+        stats = assignment_stats(students, columns, scores)
+        entries = []
+        if stats:
+            entries.append(("Stats", stats))
+        entries.extend(roster_entries(students))
+        emails = [email for email, _ in students]
+        entries.extend(score_matrix_entries(emails, columns, scores))
+        for key, value in entries:
+            writer.add(key, value)
+
+        metrics.lap("stats", rows=len(students))
+
+        if isinstance(values, RowStream):
+            #the chunks were read over time: publish them only if none of them saw a later edit
+            if values.reads > stream_reads: #blank chunks read after the last rows
+                metrics.lap("sheets_fetch", rows=0, api_calls=values.reads - stream_reads)
+            with request_budget(values.budget): #charged to the fetch's run, like the chunk reads
+                ensure_revision(client, course.spreadsheet_id, revision)
+            metrics.lap("revision_check", api_calls=1)
+        summary = writer.commit()
+        record_revision(redis_client, revision, extra=bins_digest)
+        write_score_matrix_files(emails, columns, scores, course.name)
+        metrics.lap(
+            "redis_write",
+            rows=summary["added"] + summary["changed"] + summary["removed"],
+            api_calls=summary["round_trips"] + 1, #+1 for record_revision
+            bytes_written=summary["bytes_written"],
+        )
+        print(f"✓ Synced {record_count} student records to Redis (generation {summary['generation']}): "
+              f"{summary['added']} added, {summary['changed']} changed, {summary['removed']} removed, "
+              f"{summary['unchanged']} unchanged ({summary['round_trips']} round trips)")
+        metrics.finish(redis_client, success=True)
         
     except Exception as e:
         print(f"Error: {e}")
-        print(f"Spreadsheet ID: {SPREADSHEET_ID}")
-        print(f"Sheet name: {SHEETNAME}")
+        print(f"Course: {course.name}")
+        print(f"Spreadsheet ID: {course.spreadsheet_id}")
+        print(f"Sheet name: {course.sheet_name}")
+        if metrics is not None:
+            metrics.finish(redis_client, success=False)
         raise
 
 if __name__ == "__main__":
-    update_redis()
-
+    arg_parser = argparse.ArgumentParser(description="Sync the gradebook worksheet into Redis.")
+    arg_parser.add_argument("--force", action="store_true",
+                            help="sync even if the spreadsheet is unchanged and rewrite every key")
+    arg_parser.add_argument("--course", help="course to sync (see courses.py); defaults to the first one")
+    args = arg_parser.parse_args()
+    update_redis(force=args.force, course=find_course(args.course) if args.course else None)
@@ -1,7 +1,11 @@
-from flask import Flask, request, render_template
+from flask import Flask, request, render_template, make_response
 from werkzeug.utils import secure_filename
+from collections import OrderedDict
+import copy
+import hashlib
 import json
 import os
+import threading
 import parser
 import jsonschema
 from deprecated import deprecated
@@ -73,6 +77,76 @@ with open("meta/defaults.json", "r") as defaults_file:
 DEFAULT_SCHOOL = default["school"]
 DEFAULT_CLASS = default["class"]
 
+# The concept map POST / draws: its categories and their concepts, dates and levels
+CATEGORY_MAPPING = {
+    "Quest": ["Abstraction", "Number Representation", "Iteration", "Domain and Range", "Booleans", "Functions", "HOFs I"],
+    "Midterm": ["Algorithms", "Computers and Education", "Testing + 2048 + Mutable/Immutable", "Saving the World with Computing", "Debugging", "Scope", "Iteration and Randomness", "Recursion Tracing", "Algorithmic Complexity", "HOFs II", "Fractal"],
+    "Postterm": ["Python Advanced", "Programming Paradigms", "HCI", "Generative AI", "Ethics in AI", "Generic Base Conversion", "Concurrency", "HOFs III", "Coding Snap! Recursive Reporter and HOF", "Coding Python Data Structures"],
+    "Projects": ["Project 1: Wordle™-lite", "Project 2: Spelling Bee", "Project 3: 2048"]
+}
+POST_START_DATE = "8/26/2024"
+POST_COURSE_TERM = "Fall 2024"
+POST_CLASS_LEVELS = [
+    {"name": "Not Taught", "color": "#dddddd"},
+    {"name": "Taught", "color": "#8fbc8f"}
+]
+POST_STUDENT_LEVELS = [
+    {"name": "First Steps", "color": "#dddddd"},
+    {"name": "Needs Practice", "color": "#a3d7fc"},
+    {"name": "In Progress", "color": "#59b0f9"},
+    {"name": "Almost There", "color": "#3981c1"},
+    {"name": "Mastered", "color": "#20476a"}
+]
+
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "256"))  # rendered POST / pages kept per worker
+
+# Changes whenever the map or the template does, so ETags issued for an older page stop matching
+with open(os.path.join(app.root_path, "templates", "web_ui.html"), "rb") as template_file:
+    TREE_VERSION = hashlib.sha1(json.dumps(
+        [CATEGORY_MAPPING, POST_START_DATE, POST_COURSE_TERM, POST_CLASS_LEVELS, POST_STUDENT_LEVELS]
+    ).encode("utf-8") + template_file.read()).hexdigest()[:12]
+
+
+class ResponseCache:
+    """A thread-safe LRU of rendered pages, keyed by their ETag."""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.pages = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, etag):
+        with self.lock:
+            page = self.pages.get(etag)
+            if page is not None:
+                self.pages.move_to_end(etag)
+            return page
+
+    def put(self, etag, page):
+        if self.max_size <= 0:
+            return
+        with self.lock:
+            self.pages[etag] = page
+            self.pages.move_to_end(etag)
+            while len(self.pages) > self.max_size:
+                self.pages.popitem(last=False)
+
+
+rendered_pages = ResponseCache(RESPONSE_CACHE_SIZE)
+
+"""
+The ETag of the POST / page for a course and mastery payload. The payload is
+canonicalized to compact JSON but keeps its key order, which decides the
+mastery a concept gets when several keys match it.
+"""
+def mastery_etag(course_name, request_as_json):
+    payload = json.dumps(request_as_json, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha1(json.dumps([course_name, TREE_VERSION, payload]).encode("utf-8")).hexdigest()
+
+# Compile the meta files once at startup (also runnable as `python parser.py`);
+# requests only read the compiled maps in data/
+parser.compile_all()
+
 """
 Validates the fields of the mastery learning post request
 """
@@ -140,10 +214,8 @@ def index():
         return "URL parameter student_mastery is invalid", 400
     if use_url_class_mastery and not class_mastery.isdigit():
         return "URL parameter class_mastery is invalid", 400
-    parser.generate_map(school_name=secure_filename(school_name), course_name=secure_filename(course_name), render=True)
     try:
-        with open("data/{}_{}.json".format(secure_filename(school_name), secure_filename(course_name))) as data_file:
-            course_data = json.load(data_file)
+        course_data = parser.load_map(school_name=secure_filename(school_name), course_name=secure_filename(course_name), render=True)
     except FileNotFoundError:
         return "Class not found", 404
     start_date = course_data["start date"]
@@ -151,7 +223,7 @@ def index():
     class_levels = course_data["class levels"]
     student_levels = course_data["student levels"]
     course_node_count = course_data["count"]
-    course_nodes = course_data["nodes"]
+    course_nodes = copy.deepcopy(course_data["nodes"])  # the cached map is shared between requests
     assign_node_levels(course_nodes, len(student_levels), len(class_levels))
     return render_template("web_ui.html",
                            start_date=start_date,
@@ -169,9 +241,23 @@ def generate_cm_from_post_parameters():
     print("In generate_cm_from_post_parameters")
     request_as_json = request.get_json()
     print("Request", request)
+    course_name = request_as_json.get("class", DEFAULT_CLASS) if isinstance(request_as_json, dict) else DEFAULT_CLASS
+
+    # Students with the same mastery get the same page: answer repeat views with
+    # a 304 and identical profiles from the cache, without building or rendering
+    etag = mastery_etag(course_name, request_as_json)
+    if request.if_none_match.contains(etag):
+        response = make_response("", 304)
+        response.set_etag(etag)
+        return response
+    page = rendered_pages.get(etag)  # only valid payloads are ever cached
+    if page is not None:
+        response = make_response(page)
+        response.set_etag(etag)
+        return response
+
     validate_mastery_learning_post_request(request_as_json)
     school_name = request_as_json.get("school", DEFAULT_SCHOOL)
-    course_name = request_as_json.get("class", DEFAULT_CLASS)
     
     # Build dynamic tree structure from mastery data
     def build_dynamic_tree(mastery_data):
@@ -186,17 +272,9 @@ def generate_cm_from_post_parameters():
             }
         }
 
-        # Define the expected categories and their concepts based on the actual data structure
-        category_mapping = {
-            "Quest": ["Abstraction", "Number Representation", "Iteration", "Domain and Range", "Booleans", "Functions", "HOFs I"],
-            "Midterm": ["Algorithms", "Computers and Education", "Testing + 2048 + Mutable/Immutable", "Saving the World with Computing", "Debugging", "Scope", "Iteration and Randomness", "Recursion Tracing", "Algorithmic Complexity", "HOFs II", "Fractal"],
-            "Postterm": ["Python Advanced", "Programming Paradigms", "HCI", "Generative AI", "Ethics in AI", "Generic Base Conversion", "Concurrency", "HOFs III", "Coding Snap! Recursive Reporter and HOF", "Coding Python Data Structures"],
-            "Projects": ["Project 1: Wordle™-lite", "Project 2: Spelling Bee", "Project 3: 2048"]
-        }
-
         # Build tree structure
         node_id = 2
-        for category, expected_concepts in category_mapping.items():
+        for category, expected_concepts in CATEGORY_MAPPING.items():
             category_node = {
                 "id": node_id,
                 "name": category,
@@ -261,43 +339,30 @@ def generate_cm_from_post_parameters():
     course_nodes, course_node_count = build_dynamic_tree(request_as_json)
     print("Dynamic tree built with", course_node_count, "nodes and", len(course_nodes["children"]), "categories")
 
-    # Use default values for other fields
-    start_date = "8/26/2024"
-    course_term = "Fall 2024"
-    class_levels = [
-        {"name": "Not Taught", "color": "#dddddd"},
-        {"name": "Taught", "color": "#8fbc8f"}
-    ]
-    student_levels = [
-        {"name": "First Steps", "color": "#dddddd"},
-        {"name": "Needs Practice", "color": "#a3d7fc"},
-        {"name": "In Progress", "color": "#59b0f9"},
-        {"name": "Almost There", "color": "#3981c1"},
-        {"name": "Mastered", "color": "#20476a"}
-    ]
-
     # Assign mastery levels to the dynamic tree
     assign_node_levels(course_nodes)
 
-    return render_template("web_ui.html",
-                           start_date=start_date,
+    page = render_template("web_ui.html",
+                           start_date=POST_START_DATE,
                            course_name=course_name,
-                           course_term=course_term,
-                           class_levels=class_levels,
-                           student_levels=student_levels,
+                           course_term=POST_COURSE_TERM,
+                           class_levels=POST_CLASS_LEVELS,
+                           student_levels=POST_STUDENT_LEVELS,
                            use_url_class_mastery=False,
                            course_node_count=course_node_count,
                            course_data=course_nodes)
+    rendered_pages.put(etag, page)
+    response = make_response(page)
+    response.set_etag(etag)
+    return response
 
 
 @app.route('/parse', methods=["POST"])
 def parse():
     school_name = request.args.get("school_name", DEFAULT_SCHOOL)
     course_name = request.form.get("course_name", DEFAULT_CLASS)
-    parser.generate_map(school_name=secure_filename(school_name), course_name=secure_filename(course_name), render=False)
     try:
-        with open("data/{}_{}.json".format(secure_filename(school_name), secure_filename(course_name))) as data_file:
-            course_data = json.load(data_file)
+        course_data = parser.load_map(school_name=secure_filename(school_name), course_name=secure_filename(course_name), render=False)
     except FileNotFoundError:
         return "Class not found", 404
     return course_data
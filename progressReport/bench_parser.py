@@ -0,0 +1,69 @@
+"""
+Benchmark of the meta file parser on synthetic course maps.
+
+Generates a meta file per size, with the given number of nodes spread over
+categories, concepts and sub-concepts (depths 1 to 3), then times
+read_meta and build_map over several runs and reports the best run.
+
+    python bench_parser.py --nodes 100,1000,10000 --runs 5
+"""
+import argparse
+import io
+import time
+
+import parser
+
+
+def synthetic_meta(num_nodes, fanout=10):
+    """A meta file with num_nodes nodes: categories of fanout concepts of fanout sub-concepts."""
+    lines = [
+        "name: Bench",
+        "term: Fall 2024",
+        "orientation: left to right",
+        "start date: 2024 08 26",
+        "styles:",
+        "    name: root, shape: ellipse, style: filled, fillcolor: #3A73A5",
+        "    name: default, shape: ellipse, style: filled, fillcolor: #E0E0E0",
+        "class levels:",
+        "    Not Taught: #dddddd",
+        "    Taught: #8fbc8f",
+        "student levels:",
+        "    First Steps: #dddddd",
+        "    Mastered: #20476a",
+        "nodes:",
+    ]
+    for i in range(num_nodes):
+        position = i % (fanout * fanout)
+        depth = 1 if position == 0 else 2 if (position - 1) % fanout == 0 else 3
+        lines.append("{}Node {} [default, Week{}]".format(" " * parser.INDENT * depth, i, i % 15 + 1))
+    lines.append("end")
+    return "\n".join(lines) + "\n"
+
+
+def best_of(runs, func):
+    best = float("inf")
+    for _ in range(runs):
+        started = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--nodes", default="100,1000,10000", help="comma-separated node counts")
+    arg_parser.add_argument("--runs", type=int, default=5)
+    args = arg_parser.parse_args()
+
+    print("{:>8}{:>12}{:>14}{:>14}".format("nodes", "meta KB", "read_meta ms", "build_map ms"))
+    for num_nodes in map(int, args.nodes.split(",")):
+        meta = synthetic_meta(num_nodes)
+        read_s, parsed = best_of(args.runs, lambda: parser.read_meta(io.StringIO(meta)))
+        name, orientation, start_date, term, class_levels, student_levels, styles, root = parsed
+        build_s, _ = best_of(args.runs, lambda: parser.build_map(
+            name, term, start_date, class_levels, student_levels, root, render=True))
+        print("{:>8}{:>12.1f}{:>14.2f}{:>14.2f}".format(num_nodes, len(meta) / 1024, read_s * 1000, build_s * 1000))
+
+
+if __name__ == "__main__":
+    main()
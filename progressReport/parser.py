@@ -1,12 +1,28 @@
+import itertools
 import re
 import json
+import os
+import sys
+import tempfile
+import threading
 
+META_DIR = "meta"
+DATA_DIR = "data"
 
-class Node:
-    count = 0
+# Compiled course maps loaded by the app, per artifact: artifact path -> (mtime, course map)
+_course_maps = {}
+_course_maps_lock = threading.Lock()
 
-    def __init__(self, label, style, week, parent=None, children=None):
-        self.id = Node.count + 1
+
+class Node:
+    """
+    A node of a course map. ids are allocated by the read_meta call that
+    creates the node, in file order starting with 1 for the root.
+    """
+    __slots__ = ("id", "label", "style", "week", "parent", "children")
+
+    def __init__(self, node_id, label, style, week, parent=None, children=None):
+        self.id = node_id
         self.label = label
         self.style = style
         self.week = int(week)
@@ -14,11 +30,46 @@ class Node:
         if children is None:
             children = []
         self.children = children
-        Node.count += 1
+
+
+class MetaError(ValueError):
+    """A meta file line that does not parse."""
+
+    def __init__(self, line_number, message):
+        super().__init__("line {}: {}".format(line_number, message))
+        self.line_number = line_number
+
+
+INDENT = 4  # spaces per level of the node tree
+
+NAME_PATTERN = re.compile(r"name: ([A-Za-z0-9\-_]+)")
+TERM_PATTERN = re.compile(r"term: ([A-Za-z0-9]+) ([0-9]+)")
+ORIENTATION_PATTERN = re.compile(r"orientation: ([A-Za-z]+) to ([A-Za-z]+)")
+START_DATE_PATTERN = re.compile(r"start date: (\d{4}) (\d{2}) (\d{2})")
+STYLE_PATTERN = re.compile(r"\s*name: ([A-Za-z0-9]+), shape: ([A-Za-z]+), style: ([A-Za-z]+), fillcolor: #([A-Za-z0-9]+)")
+LEVEL_PATTERN = re.compile(r"\s*([A-Za-z-_\s]+): #([A-Za-z0-9]+)")
+NODE_PATTERN = re.compile(r"(\s+)([^\[]+) \[([A-Za-z0-9]+), Week([0-9]+)]")
+
+# Unindented lines that start a section; the section's entries are the indented lines below
+SECTIONS = {"styles:": "STYLE", "class levels:": "CLASS_LEVEL", "student levels:": "STUDENT_LEVEL", "nodes:": "NODE"}
+
+
+def _match(pattern, line, line_number, expected):
+    match = pattern.match(line)
+    if match is None:
+        raise MetaError(line_number, "expected {}, got {!r}".format(expected, line.strip()))
+    return match
 
 
 def read_meta(f):
-    Node.count = 0
+    """
+    Parses a meta file in one pass over its lines. Unindented lines are header
+    fields (name, term, orientation, start date), section starts or "end";
+    indented lines are entries of the current section. A node's parent is the
+    closest node above it indented one level (INDENT spaces) less.
+    Raises MetaError, with the line number, on a line that does not parse.
+    """
+    next_id = itertools.count(1).__next__  # per parse, so concurrent parses do not share ids
     name = ""
     term = ""
     orientation = ""
@@ -27,106 +78,93 @@ def read_meta(f):
     class_levels = []
     student_levels = []
     nodes = []
-    root = Node(label="", style="root", week=0, parent=None, children=nodes)
-
-    parse_mode = None
-
-    cur_node_parent = None
-    cur_node_parent_depth = 0
-
-    for line in f.readlines():
-        if line.startswith("name:"):
-            name = re.search(r"name: ([A-Za-z0-9\-_]+)", line).group(1)
-        if line.startswith("term:"):
-            term_match = re.search(r"term: ([A-Za-z0-9]+) ([0-9]+)", line)
-            term = "{} {}".format(term_match.group(1), term_match.group(2))
-        if line.startswith("orientation:"):
-            orientation_match = re.search(r"orientation: ([A-Za-z]+) to ([A-Za-z]+)", line)
-            orientation = "LR" if orientation_match.group(1) == "left" and orientation_match.group(
-                2) == "right" else "RL"
-        if line.startswith("start date:"):
-            date_match = re.search(r"start date: (\d{4}) (\d{2}) (\d{2})", line)
-            start_date.extend([int(date_match.group(1)), int(date_match.group(2)), int(date_match.group(3))])
-        if line.startswith("styles:"):
-            parse_mode = "STYLE"
-            continue
-        if line.startswith("class levels:"):
-            parse_mode = "CLASS_LEVEL"
-            continue
-        if line.startswith("student levels:"):
-            parse_mode = "STUDENT_LEVEL"
-            continue
-        if line.startswith("nodes:"):
-            parse_mode = "NODE"
+    root = Node(next_id(), label="", style="root", week=0, parent=None, children=nodes)
+
+    section = None
+    # parents[d] is the parent of the next node at depth d + 1; None for the top level, whose nodes have no parent
+    parents = [None]
+
+    for line_number, line in enumerate(f, 1):
+        if not line.strip():
             continue
-        if line.startswith("end"):
-            parse_mode = None
 
-        if parse_mode == "STYLE":
-            style_match = re.search(
-                r"name: ([A-Za-z0-9]+), shape: ([A-Za-z]+), style: ([A-Za-z]+), fillcolor: #([A-Za-z0-9]+)", line)
+        if not line[0].isspace():
+            if line.startswith("name:"):
+                name = _match(NAME_PATTERN, line, line_number, "'name: <course>'").group(1)
+            elif line.startswith("term:"):
+                term = "{} {}".format(*_match(TERM_PATTERN, line, line_number, "'term: <season> <year>'").groups())
+            elif line.startswith("orientation:"):
+                start, end = _match(ORIENTATION_PATTERN, line, line_number, "'orientation: <side> to <side>'").groups()
+                orientation = "LR" if start == "left" and end == "right" else "RL"
+            elif line.startswith("start date:"):
+                date_match = _match(START_DATE_PATTERN, line, line_number, "'start date: YYYY MM DD'")
+                start_date.extend(int(part) for part in date_match.groups())
+            elif line.startswith("end"):
+                section = None
+                continue
+            else:
+                header = next((header for header in SECTIONS if line.startswith(header)), None)
+                if header is None and section is not None:
+                    raise MetaError(line_number, "expected an indented entry or 'end', got {!r}".format(line.strip()))
+                section = SECTIONS.get(header)
+                continue
+            section = None
+        elif section == "STYLE":
+            style_match = _match(STYLE_PATTERN, line, line_number,
+                                 "'name: <style>, shape: <shape>, style: <style>, fillcolor: #<color>'")
             styles[style_match.group(1)] = {
                 "shape": style_match.group(2),
                 "style": style_match.group(3),
                 "fillcolor": "#{}".format(style_match.group(4))
             }
-        elif parse_mode == "CLASS_LEVEL":
-            level_match = re.search(r"\s*([A-Za-z-_\s]+): #([A-Za-z0-9]+)", line)
-            class_levels.append({"name": level_match.group(1), "color": "#{}".format(level_match.group(2))})
-        elif parse_mode == "STUDENT_LEVEL":
-            level_match = re.search(r"\s*([A-Za-z-_\s]+): #([A-Za-z0-9]+)", line)
-            student_levels.append({"name": level_match.group(1), "color": "#{}".format(level_match.group(2))})
-        elif parse_mode == "NODE":
-            node_match = re.search(r"(\s+)([^\[]+) \[([A-Za-z0-9]+), Week([0-9]+)]", line)
-            root.week = max(root.week, int(node_match.group(4)))
-            if len(node_match.group(1)) // 4 == 1:
-                cur_node_parent = Node(node_match.group(2), node_match.group(3), node_match.group(4))
-                nodes.append(cur_node_parent)
-                cur_node_parent_depth = 1
-            elif len(node_match.group(1)) // 4 < cur_node_parent_depth:
-                cur_node_parent = cur_node_parent.parent
-                cur_node_parent_depth -= 1
-                cur_node_parent.parent.children.append(
-                    Node(node_match.group(2), node_match.group(3), node_match.group(4), cur_node_parent))
-            elif len(node_match.group(1)) // 4 == cur_node_parent_depth:
-                new_children = Node(node_match.group(2), node_match.group(3), node_match.group(4), cur_node_parent.parent)
-                cur_node_parent.parent.children.append(new_children)
-                cur_node_parent = new_children
-            elif len(node_match.group(1)) // 4 > cur_node_parent_depth:
-                new_children = Node(node_match.group(2), node_match.group(3), node_match.group(4), cur_node_parent)
-                cur_node_parent.children.append(new_children)
-                cur_node_parent = new_children
-                cur_node_parent_depth += 1
-
-    f.close()
+        elif section in ("CLASS_LEVEL", "STUDENT_LEVEL"):
+            level_match = _match(LEVEL_PATTERN, line, line_number, "'<level>: #<color>'")
+            levels = class_levels if section == "CLASS_LEVEL" else student_levels
+            levels.append({"name": level_match.group(1), "color": "#{}".format(level_match.group(2))})
+        elif section == "NODE":
+            indent, label, style, week = _match(NODE_PATTERN, line, line_number, "'<name> [<style>, Week<n>]'").groups()
+            depth = len(indent.expandtabs(INDENT)) // INDENT
+            if not 1 <= depth <= len(parents):
+                raise MetaError(line_number, "{!r} is indented {} levels, but nodes start at level 1 and go at most "
+                                             "one level deeper than the node above".format(label, depth))
+            del parents[depth:]
+            parent = parents[-1]
+            node = Node(next_id(), label, style, week, parent)
+            (parent.children if parent else nodes).append(node)
+            parents.append(node)
+            root.week = max(root.week, node.week)
 
     root.label = name
 
     return name, orientation, start_date, term, class_levels, student_levels, styles, root
 
 
-def to_json(school_name, course_name, term, start_date, class_levels, student_levels, root, render=False):
-    def nodes_to_json(node):
+def build_map(course_name, term, start_date, class_levels, student_levels, root, render=False):
+    """
+    Builds the course map dict from the tree read_meta returns. Leaves only get
+    a "children" list when render is set. The tree is walked with an explicit
+    stack, so its depth is not bound by the recursion limit.
+    """
+    nodes_json = []
+    count = 0
+    # (node, list its JSON goes in, its parent's label); nodes below the root have no parent
+    stack = [(root, nodes_json, "null")]
+    while stack:
+        node, siblings_json, parent_label = stack.pop()
+        count += 1
+        node_json = {
+            "id": node.id,
+            "name": node.label,
+            "parent": parent_label,
+        }
         if render or node.children:
-            nodes_json = {
-                "id": node.id,
-                "name": node.label,
-                "parent": node.parent.label if node.parent else "null",
-                "children": [nodes_to_json(c) for c in node.children],
-                "data": {
-                    "week": node.week,
-                }
-            }
-        else:
-            nodes_json = {
-                "id": node.id,
-                "name": node.label,
-                "parent": node.parent.label if node.parent else "null",
-                "data": {
-                    "week": node.week,
-                }
-            }
-        return nodes_json
+            node_json["children"] = []
+            child_parent_label = node.label if node is not root else "null"
+            stack.extend((child, node_json["children"], child_parent_label) for child in reversed(node.children))
+        node_json["data"] = {
+            "week": node.week,
+        }
+        siblings_json.append(node_json)
 
     json_out = {
         "name": course_name,
@@ -134,18 +172,83 @@ def to_json(school_name, course_name, term, start_date, class_levels, student_le
         "start date": "{}/{}/{}".format(start_date[1], start_date[2], start_date[0]),
         "class levels": class_levels,
         "student levels": student_levels,
-        "count": Node.count,
-        "nodes": nodes_to_json(root)
+        "count": count,
+        "nodes": nodes_json[0]
     }
+    return json_out
 
-    with open('data/{}_{}.json'.format(school_name, course_name), 'w', encoding='utf-8') as json_out_file:
-        json.dump(json_out, json_out_file, indent=4)
 
-def generate_map(school_name, course_name, render=False):
-    print("Log: {}_{}".format(school_name, course_name))
+def artifact_path(school_name, course_name, render=False):
+    return "{}/{}_{}{}.json".format(DATA_DIR, school_name, course_name, ".render" if render else "")
+
+
+def write_json_atomic(path, data):
+    """Replaces path through a temporary file and a rename, so readers never see a partial file."""
+    directory = os.path.dirname(path)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=".json")
     try:
-        with open("meta/{}_{}.txt".format(school_name, course_name), "r") as f:
-            name, orientation, start_date, term, class_levels, student_levels, styles, root = read_meta(f)
-            to_json(school_name, course_name, term, start_date, class_levels, student_levels, root, render)
-    except FileNotFoundError:
-        return
\ No newline at end of file
+        with os.fdopen(fd, "w", encoding="utf-8") as tmp_file:
+            json.dump(data, tmp_file, indent=4)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def to_json(school_name, course_name, term, start_date, class_levels, student_levels, root, render=False):
+    json_out = build_map(course_name, term, start_date, class_levels, student_levels, root, render)
+    write_json_atomic(artifact_path(school_name, course_name, render), json_out)
+
+
+def generate_map(school_name, course_name):
+    """
+    Compiles meta/<school>_<class>.txt into its two artifacts in data/: the
+    map /parse returns and the .render map the tree page draws.
+    """
+    print("Log: {}_{}".format(school_name, course_name))
+    with open("{}/{}_{}.txt".format(META_DIR, school_name, course_name), "r") as f:
+        name, orientation, start_date, term, class_levels, student_levels, styles, root = read_meta(f)
+    for render in (False, True):
+        to_json(school_name, course_name, term, start_date, class_levels, student_levels, root, render)
+
+
+def compile_all():
+    """
+    The build step: compiles every meta file into data/. A meta file that fails
+    to parse is reported and skipped, leaving its previous artifacts in place.
+    Returns the number of failures.
+    """
+    failures = 0
+    for meta_file in sorted(os.listdir(META_DIR)):
+        if not meta_file.endswith(".txt") or "_" not in meta_file:
+            continue
+        school_name, course_name = meta_file[:-len(".txt")].split("_", 1)
+        try:
+            generate_map(school_name, course_name)
+        except Exception as e:
+            print("Error: could not compile {}: {!r}".format(meta_file, e))
+            failures += 1
+    return failures
+
+
+def load_map(school_name, course_name, render=False):
+    """
+    Returns the course map compiled into data/ by the build step, read from
+    disk at most once per compilation: later calls are served from memory
+    until the artifact's mtime changes. Raises FileNotFoundError when the
+    class has not been compiled. The map is shared between requests, so
+    callers must copy it before modifying it.
+    """
+    path = artifact_path(school_name, course_name, render)
+    with _course_maps_lock:
+        mtime = os.stat(path).st_mtime_ns
+        cached = _course_maps.get(path)
+        if cached is None or cached[0] != mtime:
+            with open(path, "r", encoding="utf-8") as data_file:
+                cached = (mtime, json.load(data_file))
+            _course_maps[path] = cached
+        return cached[1]
+
+
+if __name__ == "__main__":
+    sys.exit(1 if compile_all() else 0)
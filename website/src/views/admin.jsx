@@ -280,29 +280,31 @@ export default function Admin() {
   };
 
   const handleScoreClick = (data, index) => {
-    // 'data' here is the bar data clicked: {range: "50-74", count: N, students: [...], ...}
-    if (!selected || !data.students) return;
+    // 'data' here is the bar data clicked: {range: "50", count: N, ...}
+    if (!selected || !data.count) return;
 
     const clickedRange = data.range;
     
     // Check if this score range is already selected
-    const isAlreadySelected = scoreSelected.includes(clickedRange);
-    
-    let newSelectedScores;
-    let newStudentsByScore;
-    
-    if (isAlreadySelected) {
+    if (scoreSelected.includes(clickedRange)) {
       // Remove this score range
-      newSelectedScores = scoreSelected.filter(r => r !== clickedRange);
-      newStudentsByScore = studentsByScore.filter(group => group.range !== clickedRange);
-    } else {
-      // Add this score range
-      newSelectedScores = [...scoreSelected, clickedRange];
-      newStudentsByScore = [...studentsByScore, { range: clickedRange, students: data.students }];
+      setScoreSelected(prev => prev.filter(r => r !== clickedRange));
+      setStudentsByScore(prev => prev.filter(group => group.range !== clickedRange));
+      return;
     }
-    
-    setScoreSelected(newSelectedScores);
-    setStudentsByScore(newStudentsByScore);
+
+    // Add this score range; its students are fetched only when it is selected
+    setScoreSelected(prev => [...prev, clickedRange]);
+    setStudentsByScoreLoading(true);
+    setStudentsByScoreError(null);
+    const { section, name } = selected;
+    apiv2.get(`/admin/studentScores/${encodeURIComponent(section)}/${encodeURIComponent(name)}/${encodeURIComponent(clickedRange)}`)
+      .then(res => setStudentsByScore(prev => [...prev, { range: clickedRange, students: res.data.students }]))
+      .catch(err => {
+        setScoreSelected(prev => prev.filter(r => r !== clickedRange));
+        setStudentsByScoreError(err.message || 'Failed to load students');
+      })
+      .finally(() => setStudentsByScoreLoading(false));
   };
 
   /** Close the student list dialog **/
@@ -649,7 +651,12 @@ export default function Admin() {
 
 
         <DialogContent>
-            {studentsByScore.length === 0 ? (
+            {studentsByScoreError && (
+                <Typography color="error">{studentsByScoreError}</Typography>
+            )}
+            {studentsByScoreLoading && studentsByScore.length === 0 ? (
+                <Typography>Loading students…</Typography>
+            ) : studentsByScore.length === 0 ? (
                 <Typography>No students found with the selected scores.</Typography>
             ) : (
                 studentsByScore